@@ -0,0 +1,58 @@
+"""Compares the memory and the running time of the clique tree backends.
+
+Builds a random k-tree edge by edge, without maintaining the insertable
+edges, and reports the time spent in add_edge and the memory held by the
+clique tree for every backend.
+
+    python benchmarks/bench_backends.py [n] [k]
+"""
+from __future__ import print_function
+
+import sys
+import time
+import tracemalloc
+
+from cliquetree import CliqueTree
+from generators import ktree_edges
+
+
+def run(backend, edges):
+    c = CliqueTree(backend=backend)
+    start = time.time()
+    for u, v in edges:
+        c.add_edge(u, v, update_insertable=False)
+    elapsed = time.time() - start
+    del c
+
+    # measure the memory separately, tracing slows everything down
+    tracemalloc.start()
+    c = CliqueTree(backend=backend)
+    before = tracemalloc.get_traced_memory()[0]
+    for u, v in edges:
+        c.add_edge(u, v, update_insertable=False)
+    # the memory of the clique tree alone
+    tree_before = tracemalloc.get_traced_memory()[0]
+    tree = c.cliquetree
+    c.cliquetree = None
+    del tree
+    tree_memory = tree_before - tracemalloc.get_traced_memory()[0]
+    total = tree_before - before
+    tracemalloc.stop()
+    return elapsed, tree_memory, total
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    edges = ktree_edges(n, k)
+    print('n=%d k=%d edges=%d' % (n, k, len(edges)))
+    print('%-10s %10s %16s %16s' % ('backend', 'time (s)', 'tree (bytes)',
+                                    'total (bytes)'))
+    for backend in ('networkx', 'compact'):
+        elapsed, tree_memory, total = run(backend, edges)
+        print('%-10s %10.2f %16d %16d' % (backend, elapsed, tree_memory,
+                                          total))
+
+
+if __name__ == '__main__':
+    main()
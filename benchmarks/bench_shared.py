@@ -0,0 +1,78 @@
+"""Measures the cost of publishing the snapshots of a SharedCliqueTree.
+
+For every n, builds a random interval graph on n nodes, wraps it in a
+SharedCliqueTree, then removes and adds back some of its edges that lie in
+a single clique. It reports the average time of these updates, which also
+maintain the insertable edges, the average number of changes in the undo
+log of each one, the time spent publishing the next Snapshot per update
+and per change, and the time of the initial Snapshot. The time spent
+publishing should grow with log n, not n.
+
+    python benchmarks/bench_shared.py [k] [updates]
+"""
+from __future__ import print_function
+
+import random
+import sys
+import time
+
+import networkx as nx
+
+from cliquetree import CliqueTree
+from cliquetree import SharedCliqueTree
+from generators import interval_edges
+
+
+SIZES = [1000, 2000, 4000, 8000]
+
+
+def run(n, k, updates):
+    c = CliqueTree()
+    # a SharedCliqueTree needs all the insertable edges, which take time
+    # quadratic in n to compute, hence the small sizes
+    c.from_graph(nx.Graph(interval_edges(n, k)))
+    rng = random.Random(0)
+    edges = [(u, v) for u, v in c.G.edges()
+             if len(c.node_in_cliques[u] & c.node_in_cliques[v]) == 1]
+    edges = rng.sample(edges, updates)
+    start = time.time()
+    shared = SharedCliqueTree(c)
+    first = time.time() - start
+
+    publishing = [0.0, 0]
+    publish = shared._publish
+
+    def timed_publish(entries):
+        start = time.time()
+        result = publish(entries)
+        publishing[0] += time.time() - start
+        publishing[1] += len(entries)
+        return result
+    shared._publish = timed_publish
+
+    start = time.time()
+    for u, v in edges:
+        shared.remove_edge(u, v)
+        shared.add_edge(u, v)
+    total = time.time() - start
+    updates *= 2
+    return (total / updates, publishing[1] / updates,
+            publishing[0] / updates, publishing[0] / publishing[1], first)
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print('%8s %12s %8s %14s %14s %16s' % (
+        'n', 'update (us)', 'changes', 'publish (us)', 'per change (us)',
+        'first snapshot (s)'))
+    for n in SIZES:
+        update, changes, publish, per_change, first = run(n, k, updates)
+        print('%8d %12.1f %8d %14.1f %14.2f %16.2f' % (
+            n, update * 1e6, changes, publish * 1e6, per_change * 1e6,
+            first))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
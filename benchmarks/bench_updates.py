@@ -0,0 +1,54 @@
+"""Measures the time per edge update as the graph grows.
+
+For every n, builds a random k-tree on n nodes and reports the average time
+of the last insertions and of removing edges that belong to a single clique,
+without maintaining the insertable edges. The time per update should not
+depend on n.
+
+    python benchmarks/bench_updates.py [k] [updates]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from cliquetree import CliqueTree
+from generators import ktree_edges
+
+
+SIZES = [1000, 2000, 4000, 8000, 16000]
+
+
+def run(n, k, updates):
+    edges = ktree_edges(n, k)
+    c = CliqueTree()
+    for u, v in edges[:-updates]:
+        c.add_edge(u, v, update_insertable=False)
+    start = time.time()
+    for u, v in edges[-updates:]:
+        c.add_edge(u, v, update_insertable=False)
+    add_time = (time.time() - start) / updates
+
+    removed = 0
+    start = time.time()
+    for u, v in reversed(edges):
+        if removed == updates:
+            break
+        if len(c.node_in_cliques[u].intersection(c.node_in_cliques[v])) == 1:
+            c.remove_edge(u, v, update_insertable=False)
+            removed += 1
+    remove_time = (time.time() - start) / max(removed, 1)
+    return add_time, remove_time
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print('%8s %16s %16s' % ('n', 'add_edge (us)', 'remove_edge (us)'))
+    for n in SIZES:
+        add_time, remove_time = run(n, k, updates)
+        print('%8d %16.1f %16.1f' % (n, add_time * 1e6, remove_time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Random chordal graphs for the benchmarks."""
+import bisect
+import random
+
+
+def ktree_edges(n, k, seed=0):
+    """Returns the edges of a random k-tree on n nodes, in an order that keeps
+    the graph chordal after every insertion."""
+    rng = random.Random(seed)
+    cliques = [tuple(range(k + 1))]
+    edges = [(u, v) for u in range(k + 1) for v in range(u + 1, k + 1)]
+    for v in range(k + 1, n):
+        base = rng.choice(cliques)
+        drop = rng.randrange(k + 1)
+        sep = base[:drop] + base[drop + 1:]
+        edges.extend((u, v) for u in sep)
+        cliques.append(sep + (v, ))
+    return edges
+
+
+def interval_edges(n, k, seed=0):
+    """Returns the edges of the interval graph of n random intervals in
+    [0, 1], with k intervals over each point on average, in an order that
+    keeps the graph chordal after every insertion."""
+    rng = random.Random(seed)
+    intervals = []
+    for _ in range(n):
+        start = rng.random()
+        intervals.append((start, start + rng.random() * 2.0 * k / n))
+    # the interval that ends first is simplicial, so adding the nodes by
+    # decreasing right end connects each one to a clique: the nodes added
+    # before v that start before v ends
+    order = sorted(range(n), key=lambda v: -intervals[v][1])
+    starts = []
+    added = []
+    edges = []
+    for v in order:
+        i = bisect.bisect_right(starts, intervals[v][1])
+        edges.extend((u, v) for u in added[:i])
+        i = bisect.bisect_right(starts, intervals[v][0])
+        starts.insert(i, intervals[v][0])
+        added.insert(i, v)
+    return edges
+
+
+def split_edges(n, k, p=0.5, seed=0):
+    """Returns the edges of a random split graph on n nodes: a clique on k of
+    them and an independent set of the rest, each connected to every node
+    of the clique with probability p. The order keeps the graph chordal
+    after every insertion."""
+    rng = random.Random(seed)
+    edges = [(u, v) for v in range(k) for u in range(v)]
+    for v in range(k, n):
+        edges.extend((u, v) for u in range(k) if rng.random() < p)
+    return edges
+
+
+GENERATORS = {
+    'ktree': ktree_edges,
+    'interval': interval_edges,
+    'split': split_edges,
+}
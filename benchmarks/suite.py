@@ -0,0 +1,210 @@
+"""Benchmark suite of the CliqueTree operations.
+
+For every generator of random chordal graphs, number of nodes n and clique
+size k, builds the graph from all but its last edges with from_graph and
+times the operations on it: update_insertable, query_edge, is_insertable,
+copy, update_deletable, single and batched edge insertions (of the last
+edges) and removals, keeping the fastest of a few runs, and the peak
+memory of from_graph. The results are printed as a table and can be saved
+as JSON, to compare two revisions:
+
+    python benchmarks/suite.py --json before.json
+    python benchmarks/suite.py --compare before.json
+
+Comparing reports the ratio of the time per operation, or of the peak
+memory, of every benchmark to the baseline, and exits with status 1 if any
+of them exceeds the threshold.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import networkx as nx
+
+from cliquetree import CliqueTree
+from generators import GENERATORS
+
+
+def _timed(func, count=1):
+    start = time.time()
+    func()
+    return time.time() - start, count
+
+
+def _deletable_edges(c, edges, count):
+    """Returns up to count of the edges that can be removed one after the
+    other, i.e. that belong to a single clique."""
+    chosen = []
+    for u, v in reversed(edges):
+        if len(chosen) == count:
+            break
+        if c.G.has_edge(u, v) and len(c.node_in_cliques[u].intersection(
+                c.node_in_cliques[v])) == 1:
+            chosen.append((u, v))
+    return chosen
+
+
+def run(edges, updates, seed=0):
+    """Returns a dict from the operation to its total time and count."""
+    rng = random.Random(seed)
+    head, tail = edges[:-updates], edges[-updates:]
+    G = nx.Graph(head)
+    results = {}
+
+    c = CliqueTree()
+    results['from_graph'] = _timed(lambda: c.from_graph(G))
+    nodes = rng.sample(list(c.G), min(updates, len(c.G)))
+    results['update_insertable'] = _timed(
+        lambda: [c.update_insertable(v) for v in nodes], len(nodes))
+    pairs = [tuple(rng.sample(nodes, 2)) for _ in range(updates)]
+    results['query_edge'] = _timed(
+        lambda: [c.query_edge(u, v) for u, v in pairs], len(pairs))
+    results['is_insertable'] = _timed(
+        lambda: [c.is_insertable(u, v) for u, v in pairs], len(pairs))
+    results['copy'] = _timed(c.copy)
+
+    batch = c.copy()
+    results['add_edge'] = _timed(
+        lambda: [c.add_edge(u, v) for u, v in tail], len(tail))
+    results['add_edges_from'] = _timed(
+        lambda: batch.add_edges_from(tail), len(tail))
+    results['update_deletable'] = _timed(c.update_deletable)
+
+    removed = _deletable_edges(c, edges, updates)
+    results['remove_edge'] = _timed(
+        lambda: [c.remove_edge(u, v) for u, v in removed], len(removed))
+    results['remove_edges_from'] = _timed(
+        lambda: batch.remove_edges_from(removed), len(removed))
+    return results
+
+
+def peak_memory(edges):
+    """Returns the peak and the final memory, in bytes, allocated while
+    building the clique tree of the graph with from_graph."""
+    G = nx.Graph(edges)
+    tracemalloc.start()
+    c = CliqueTree()
+    c.from_graph(G)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, current
+
+
+def _revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Prints the ratio of the time per operation, or of the peak memory, to
+    the baseline and returns the number of ratios above threshold."""
+    def key(record):
+        return (record['generator'], record['n'], record['k'],
+                record['operation'])
+    old = dict((key(record), record) for record in baseline['results'])
+    regressions = 0
+    print('\n%-10s %7s %4s %-18s %8s' % ('generator', 'n', 'k', 'operation',
+                                         'ratio'))
+    for record in results:
+        base = old.get(key(record))
+        metric = 'per_op' if 'per_op' in record else 'peak_bytes'
+        if base is None or not base.get(metric) or not record[metric]:
+            continue
+        ratio = record[metric] / base[metric]
+        flag = ''
+        if ratio > threshold:
+            flag = ' REGRESSION'
+            regressions += 1
+        print('%-10s %7d %4d %-18s %8.2f%s' % (key(record) + (ratio, flag)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the CliqueTree operations.')
+    parser.add_argument('--generators', nargs='+', default=sorted(GENERATORS),
+                        choices=sorted(GENERATORS))
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[100, 200, 400], help='numbers of nodes')
+    parser.add_argument('--k', nargs='+', type=int, default=[3, 10],
+                        help='clique sizes')
+    parser.add_argument('--updates', type=int, default=50,
+                        help='operations timed per benchmark')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per benchmark, the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='do not measure the memory')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write the results to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results to a previous run')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    records = []
+    print('%-10s %7s %4s %-18s %8s %14s' % ('generator', 'n', 'k',
+                                            'operation', 'count',
+                                            'per op (us)'))
+    for name in args.generators:
+        for n in args.sizes:
+            for k in args.k:
+                edges = GENERATORS[name](n, k, seed=args.seed)
+                # the best of the repetitions is the least noisy
+                results = run(edges, args.updates, args.seed)
+                for _ in range(args.repeat - 1):
+                    for operation, timing in run(edges, args.updates,
+                                                 args.seed).items():
+                        results[operation] = min(results[operation], timing)
+                for operation, (seconds, count) in sorted(results.items()):
+                    per_op = seconds / count if count else None
+                    records.append({'generator': name, 'n': n, 'k': k,
+                                    'operation': operation, 'count': count,
+                                    'seconds': seconds, 'per_op': per_op})
+                    print('%-10s %7d %4d %-18s %8d %14.1f' %
+                          (name, n, k, operation, count,
+                           (per_op or 0) * 1e6))
+                if not args.no_memory:
+                    peak, final = peak_memory(edges)
+                    records.append({'generator': name, 'n': n, 'k': k,
+                                    'operation': 'memory',
+                                    'peak_bytes': peak,
+                                    'final_bytes': final})
+                    print('%-10s %7d %4d %-18s %8s %14s' %
+                          (name, n, k, 'memory peak (KB)', '',
+                           peak // 1024))
+    output = {
+        'revision': _revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'networkx': nx.__version__,
+        'updates': args.updates,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': records,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(records, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,5 @@
 from .cliquetree import CliqueTree
+from .cliquetree import Transaction
+from .shared import SharedCliqueTree
+from .shared import Snapshot
+from .stats import Stats
@@ -0,0 +1,70 @@
+from functools import partial
+from functools import reduce
+from operator import lshift
+from operator import or_
+import heapq
+
+try:
+    from itertools import filterfalse
+except ImportError:  # Python 2
+    from itertools import ifilterfalse as filterfalse
+
+_bit = partial(lshift, 1)
+
+
+class VertexBits(object):
+    """Maps the vertices of a graph to dense integer ids, so that a set of
+    vertices can be stored as an integer bitmap, with the bit of each vertex
+    set. Intersections, unions and sizes of these sets are word-parallel
+    integer operations.
+
+    Ids are assigned on first use, and the ids of released vertices are
+    reused, smallest first. A bitmap is as wide as the largest id among its
+    vertices, which is below the largest number of vertices that held an id
+    at the same time.
+    """
+    __slots__ = ('ids', 'free')
+
+    def __init__(self):
+        self.ids = {}
+        # released ids, as a heap
+        self.free = []
+
+    def id(self, v):
+        try:
+            return self.ids[v]
+        except KeyError:
+            i = self.ids[v] = self._next_id()
+            return i
+
+    def _next_id(self):
+        if self.free:
+            return heapq.heappop(self.free)
+        # without free ids, the ids in use are exactly 0 .. len(ids) - 1
+        return len(self.ids)
+
+    def release(self, v):
+        """Frees the id of v, which must not be in any bitmap that is still
+        in use, so that another vertex can take it."""
+        i = self.ids.pop(v, None)
+        if i is not None:
+            heapq.heappush(self.free, i)
+
+    def bits(self, nodes):
+        """Returns the bitmap of a set of vertices."""
+        ids = self.ids
+        for v in list(filterfalse(ids.__contains__, nodes)):
+            ids[v] = self._next_id()
+        # map and reduce keep the loop over the vertices out of Python code
+        return reduce(or_, map(_bit, map(ids.__getitem__, nodes)), 0)
+
+    def contains(self, bits, v):
+        """Returns True if v is in the set of vertices with the given bitmap.
+        """
+        i = self.ids.get(v)
+        return i is not None and (bits >> i) & 1 == 1
+
+
+def popcount(bits):
+    """Returns the number of vertices in a bitmap."""
+    return bin(bits).count('1')
@@ -1,35 +1,213 @@
+from collections import deque
+from collections import namedtuple
 from copy import deepcopy
+import heapq
+import multiprocessing
 import networkx as nx
 from networkx import NetworkXNoPath
 
+from . import storage
+from .bitset import VertexBits
+from .bitset import popcount
+from .compact import CompactCliqueTree
+from .linkcut import IndexedCliqueTree
+from .stats import Stats
+from .stats import timer
+
+# the widest bitmap of a clique that is cached, per node of the clique
+_BITS_PER_NODE = 512
+
 
 class CliqueTree:
     """Defines the data structure that will be used to decide if edge addition
     respects graph chordality.
+
+    With incremental=True (the default), edge updates only recompute the
+    insertable edges of the vertices whose insertability can change, instead
+    of sweeping over the whole graph.
+
+    The clique tree is a networkx graph by default. With backend='compact' it
+    is a CompactCliqueTree instead, which does not store the separators and
+    takes a fraction of the memory.
+
+    With path_index=True, the clique tree is also indexed by a link-cut tree,
+    which finds the path between two cliques and its lightest separator in
+    O(log n) amortized time, instead of searching the clique tree.
+
+    When all the insertable edges are computed from scratch, e.g. by
+    from_graph, the work is split across a pool of worker processes if
+    processes is not 1 (None uses one per CPU). The workers read a snapshot
+    of the clique tree, which they share with the parent process where
+    processes are forked.
+
+    With bitsets=True, the nodes are mapped to dense integer ids and the
+    node set of each clique is also kept as an integer bitmap, so that the
+    separator sizes and the unions of cliques computed by update_insertable
+    are word-parallel operations; the other operations work on sets as
+    usual. This pays off on graphs with large cliques. The ids of removed
+    nodes are reused, so a bitmap is at most as wide as the largest number
+    of nodes that the graph has held, and it is only cached while it is at
+    most 512 bits per node of its clique; the bitmaps of the other cliques
+    are rebuilt when they are needed.
     """
-    def __init__(self):
+    def __init__(self, incremental=True, backend='networkx',
+                 path_index=False, processes=1, bitsets=False):
+        if backend not in ('networkx', 'compact'):
+            raise ValueError('Unknown clique tree backend: %s' % (backend, ))
+        self.backend = backend
+        self.path_index = path_index
+        self.processes = processes
+        self.bitsets = bitsets
+        # bitmaps of the cliques, computed on demand, see _clique_bits
+        self._vertex_bits = VertexBits() if bitsets else None
+        self._bits_in_clique = {}
+        # number of cliques of each size, see clique_number
+        self._clique_sizes = {}
+        # clique tree edges by the size of their separator, and the size of
+        # each edge, see largest_separator
+        self._separators_by_size = {}
+        self._separator_sizes = {}
+        # counters of the edge updates, see enable_stats
+        self.stats = None
         self.G = nx.Graph()
-        self.cliquetree = nx.Graph()
         self.node_in_cliques = {}  # cliques in which the node participates in
         self.nodes_in_clique = {}  # the set of nodes in each clique
+        self.cliquetree = self._new_cliquetree()
         self.uid = 1
         self.insertable = set()
         self.deletable = set()
+        # the only clique of each deletable edge, see clique_of_edge
+        self._deletable_clique = {}
+        self.incremental = incremental
+        # insertable partners of each node, mirrors self.insertable
+        self._insertable_nbrs = {}
+        # False when self.insertable is not known to be complete
+        self._insertable_valid = True
+        # updates not reflected in self.insertable yet, see _mark_affected
+        self._pending_nodes = set()
+        self._pending_common = set()
+        # set by add_edges_from and remove_edges_from
+        self._deferred = False
+        # True once update_deletable has been called, see _refresh_deletable
+        self._track_deletable = False
+        self._dirty_cliques = []
+        # inverse operations of the changes since the first open checkpoint
+        self._undo_log = None
+        self._checkpoints = []
 
     def __deepcopy__(self, memo):
-        obj = CliqueTree()
+        obj = CliqueTree(incremental=self.incremental, backend=self.backend,
+                         path_index=self.path_index,
+                         processes=self.processes, bitsets=self.bitsets)
         obj.G = deepcopy(self.G, memo)
         obj.cliquetree = deepcopy(self.cliquetree, memo)
         obj.node_in_cliques = deepcopy(self.node_in_cliques, memo)
         obj.nodes_in_clique = deepcopy(self.nodes_in_clique, memo)
         obj.uid = self.uid
+        obj._vertex_bits = deepcopy(self._vertex_bits, memo)
+        obj._bits_in_clique = deepcopy(self._bits_in_clique, memo)
+        obj._clique_sizes = dict(self._clique_sizes)
+        obj._separators_by_size = deepcopy(self._separators_by_size, memo)
+        obj._separator_sizes = dict(self._separator_sizes)
         obj.insertable = deepcopy(self.insertable, memo)
         obj.deletable = deepcopy(self.deletable, memo)
+        obj._deletable_clique = dict(self._deletable_clique)
+        obj._insertable_nbrs = deepcopy(self._insertable_nbrs, memo)
+        obj._insertable_valid = self._insertable_valid
+        obj._pending_nodes = deepcopy(self._pending_nodes, memo)
+        obj._pending_common = deepcopy(self._pending_common, memo)
+        obj._track_deletable = self._track_deletable
         return obj
 
     def copy(self):
         return deepcopy(self)
 
+    def _new_cliquetree(self):
+        if self.backend == 'compact':
+            tree = CompactCliqueTree(self.nodes_in_clique)
+        else:
+            tree = nx.Graph()
+        if self.path_index:
+            tree = IndexedCliqueTree(tree, self.nodes_in_clique)
+        return tree
+
+    def _separator(self, clq1, clq2):
+        """Returns the set of nodes shared by two adjacent cliques."""
+        if self.backend == 'compact':
+            return self.cliquetree.separator(clq1, clq2)
+        return self.cliquetree[clq1][clq2]['nodes']
+
+    def _separator_size(self, clq1, clq2):
+        if self.backend == 'compact':
+            return self.cliquetree.separator_size(clq1, clq2)
+        return len(self.cliquetree[clq1][clq2]['nodes'])
+
+    def _clique_bits(self, clq):
+        """Returns the bitmap of the nodes of a clique, see VertexBits."""
+        try:
+            return self._bits_in_clique[clq]
+        except KeyError:
+            pass
+        nodes = self.nodes_in_clique[clq]
+        result = self._vertex_bits.bits(nodes)
+        # a bitmap is as wide as the largest id among its nodes, so it is
+        # only kept while it takes about as much memory as the set of nodes
+        if result.bit_length() <= _BITS_PER_NODE * len(nodes):
+            self._bits_in_clique[clq] = result
+        return result
+
+    def _tree_path(self, source, target):
+        """Returns the path between two cliques of the clique tree, using a
+        bidirectional breadth-first search.
+
+        Raises NetworkXNoPath if they are in different components.
+        """
+        if source == target:
+            return [source]
+        pred = {source: None}
+        succ = {target: None}
+        forward = [source]
+        backward = [target]
+        meet = None
+        # the sides take turns on ties, so that the search stops as soon as
+        # the smaller component is exhausted, e.g. on path-like trees
+        forward_turn = True
+        while forward and backward and meet is None:
+            if len(forward) < len(backward) or (
+                    len(forward) == len(backward) and forward_turn):
+                frontier, seen, other = forward, pred, succ
+            else:
+                frontier, seen, other = backward, succ, pred
+            forward_turn = frontier is not forward
+            next_frontier = []
+            for clq in frontier:
+                for nbr in self.cliquetree.neighbors(clq):
+                    if nbr not in seen:
+                        seen[nbr] = clq
+                        next_frontier.append(nbr)
+                    if nbr in other:
+                        meet = nbr
+                        break
+                if meet is not None:
+                    break
+            if frontier is forward:
+                forward = next_frontier
+            else:
+                backward = next_frontier
+        if meet is None:
+            raise NetworkXNoPath('No path between %s and %s.' %
+                                 (source, target))
+        path = deque()
+        clq = meet
+        while clq is not None:
+            path.appendleft(clq)
+            clq = pred[clq]
+        clq = succ[meet]
+        while clq is not None:
+            path.append(clq)
+            clq = succ[clq]
+        return list(path)
+
     def _clique_is_maximal(self, nodes):
         """Returns True if the list of given nodes form a maximal clique
         """
@@ -53,36 +231,320 @@ class CliqueTree:
                     checked_neighbors.add(neighbor)
         return True
 
+    def _count_clique(self, size, delta):
+        count = self._clique_sizes.get(size, 0) + delta
+        if count:
+            self._clique_sizes[size] = count
+        else:
+            del self._clique_sizes[size]
+
+    def _recount_cliques(self):
+        self._clique_sizes = {}
+        for nodes in self.nodes_in_clique.values():
+            self._count_clique(len(nodes), 1)
+
+    def _index_separator(self, clq1, clq2):
+        e = self._edge(clq1, clq2)
+        size = self._separator_size(clq1, clq2)
+        self._separator_sizes[e] = size
+        self._separators_by_size.setdefault(size, set()).add(e)
+
+    def _unindex_separator(self, clq1, clq2):
+        e = self._edge(clq1, clq2)
+        size = self._separator_sizes.pop(e)
+        bucket = self._separators_by_size[size]
+        bucket.discard(e)
+        if not bucket:
+            del self._separators_by_size[size]
+
+    def _reindex_separators(self):
+        self._separators_by_size = {}
+        self._separator_sizes = {}
+        for clq1, clq2 in self.cliquetree.edges():
+            self._index_separator(clq1, clq2)
+
+    def _tree_add_edge(self, clq1, clq2, sep):
+        """Adds or replaces an edge of the cliquetree, keeping the index of
+        the separator sizes."""
+        if self.cliquetree.has_edge(clq1, clq2):
+            self._unindex_separator(clq1, clq2)
+        self.cliquetree.add_edge(clq1, clq2, nodes=sep)
+        self._index_separator(clq1, clq2)
+
+    def _tree_remove_edge(self, clq1, clq2):
+        self._unindex_separator(clq1, clq2)
+        self.cliquetree.remove_edge(clq1, clq2)
+
+    def _tree_remove_node(self, uid):
+        for clq in list(self.cliquetree.neighbors(uid)):
+            self._unindex_separator(uid, clq)
+        self.cliquetree.remove_node(uid)
+
     def _add_clique_node(self, uid, nodes):
         """Adds a new node in the cliquetree that represents a given node set.
         """
         self.cliquetree.add_node(uid)
+        self._bits_in_clique.pop(uid, None)
+        if self.stats is not None:
+            self.stats.count('cliques_created')
         if uid not in self.nodes_in_clique:
             self.nodes_in_clique[uid] = set()
+        else:
+            self._count_clique(len(self.nodes_in_clique[uid]), -1)
+        new_nodes = []
         for node in nodes:
             self.nodes_in_clique[uid].add(node)
             if node not in self.node_in_cliques:
                 self.node_in_cliques[node] = set()
+                new_nodes.append(node)
             self.node_in_cliques[node].add(uid)
+        self._count_clique(len(self.nodes_in_clique[uid]), 1)
+        if self._undo_log is not None:
+            self._undo_log.append(('add_clique', uid, new_nodes))
+        if self._track_deletable:
+            self._dirty_cliques.append(self.nodes_in_clique[uid])
+
+    def _remove_clique_node(self, uid):
+        """Removes a clique from the cliquetree and from the cliques of each
+        one of its nodes.
+        """
+        if self._undo_log is not None:
+            links = [(clq, self._separator(uid, clq))
+                     for clq in self.cliquetree.neighbors(uid)]
+            self._undo_log.append(('remove_clique', uid,
+                                   self.nodes_in_clique[uid], links))
+        self._tree_remove_node(uid)
+        self._bits_in_clique.pop(uid, None)
+        if self.stats is not None:
+            self.stats.count('cliques_removed')
+        nodes = self.nodes_in_clique.pop(uid)
+        self._count_clique(len(nodes), -1)
+        for node in nodes:
+            self.node_in_cliques[node].discard(uid)
+        if self._track_deletable:
+            self._dirty_cliques.append(nodes)
+
+    def _replace_clique(self, old, new):
+        """Removes the clique old, a subset of the clique new, and moves its
+        clique tree edges to new.
+        """
+        for clq in list(self.cliquetree.neighbors(old)):
+            sep = self._separator(old, clq)
+            self._cut(clq, old)
+            self._link(clq, new, sep)
+        self._remove_clique_node(old)
+
+    def _link(self, clq1, clq2, sep):
+        """Adds the edge (clq1, clq2) to the cliquetree, with separator sep.
+        """
+        if self._undo_log is not None:
+            old_sep = None
+            if self.cliquetree.has_edge(clq1, clq2):
+                old_sep = self._separator(clq1, clq2)
+            self._undo_log.append(('link', clq1, clq2, old_sep))
+        self._tree_add_edge(clq1, clq2, sep)
+
+    def _cut(self, clq1, clq2):
+        """Removes the edge (clq1, clq2) from the cliquetree."""
+        if self._undo_log is not None:
+            self._undo_log.append(('cut', clq1, clq2,
+                                   self._separator(clq1, clq2)))
+        self._tree_remove_edge(clq1, clq2)
+
+    def _graph_add_node(self, x):
+        if self._undo_log is not None:
+            self._undo_log.append(('add_node', x))
+        self.G.add_node(x)
+
+    def _graph_add_edge(self, x, y):
+        if self._undo_log is not None:
+            self._undo_log.append(('add_edge', x, y))
+        self.G.add_edge(x, y)
+
+    def _graph_remove_edge(self, x, y):
+        if self._undo_log is not None:
+            self._undo_log.append(('remove_edge', x, y))
+        self.G.remove_edge(x, y)
+
+    def _graph_remove_node(self, x):
+        """Removes a node without edges or cliques from the graph."""
+        if self._undo_log is not None:
+            self._undo_log.append(('remove_node', x))
+        self.G.remove_node(x)
+        if self._vertex_bits is not None:
+            self._vertex_bits.release(x)
+        del self.node_in_cliques[x]
+
+    def checkpoint(self):
+        """Marks the current state, so that all the changes made after it can
+        be undone with rollback().
+
+        While a checkpoint is open, every update records its inverse, at a
+        cost proportional to the size of the update, which makes it cheap to
+        try out updates and undo them, instead of copying the structure.
+        Checkpoints can be nested; each rollback() or commit() closes the
+        latest one.
+        """
+        if self._undo_log is None:
+            self._undo_log = []
+        # the pending nodes are copied, since later updates add to them
+        self._checkpoints.append((len(self._undo_log), self.uid,
+                                  self._insertable_valid,
+                                  set(self._pending_nodes),
+                                  set(self._pending_common)))
+
+    def rollback(self):
+        """Undoes all the changes made after the latest checkpoint and closes
+        it.
+        """
+        if not self._checkpoints:
+            raise ValueError('There is no checkpoint to roll back to.')
+        size, uid, insertable_valid, pending_nodes, pending_common = \
+            self._checkpoints.pop()
+        log = self._undo_log
+        self._undo_log = None
+        while len(log) > size:
+            self._undo(log.pop())
+        self.uid = uid
+        self._insertable_valid = insertable_valid
+        self._pending_nodes = pending_nodes
+        self._pending_common = pending_common
+        if self._checkpoints:
+            self._undo_log = log
+
+    def commit(self):
+        """Keeps the changes made after the latest checkpoint and closes it.
+        """
+        if not self._checkpoints:
+            raise ValueError('There is no checkpoint to commit.')
+        self._checkpoints.pop()
+        if not self._checkpoints:
+            self._undo_log = None
+
+    def transaction(self):
+        """Returns a Transaction: the updates made while it is open are kept
+        by its commit() and undone by its rollback().
+
+        Used as a context manager, the updates made in the with block are
+        kept, unless the block rolls them back or raises an exception.
+        """
+        return Transaction(self)
+
+    def try_add_edge(self, x, y):
+        """Adds the edge (x, y) tentatively, inside a new transaction.
+
+        Returns the open Transaction, whose result is the value returned by
+        add_edge. The caller can inspect the updated structure and then keep
+        the edge with commit() or remove it with rollback(), in time
+        proportional to the changes made by the insertion.
+        """
+        tx = Transaction(self)
+        tx.result = self.add_edge(x, y)
+        return tx
+
+    def _undo(self, entry):
+        """Applies the inverse of a change recorded in the undo log."""
+        op = entry[0]
+        if op == 'add_clique':
+            _, uid, new_nodes = entry
+            self._tree_remove_node(uid)
+            self._bits_in_clique.pop(uid, None)
+            nodes = self.nodes_in_clique.pop(uid)
+            self._count_clique(len(nodes), -1)
+            for node in nodes:
+                self.node_in_cliques[node].discard(uid)
+            for node in new_nodes:
+                del self.node_in_cliques[node]
+        elif op == 'remove_clique':
+            _, uid, nodes, links = entry
+            self.cliquetree.add_node(uid)
+            self.nodes_in_clique[uid] = nodes
+            self._count_clique(len(nodes), 1)
+            for node in nodes:
+                self.node_in_cliques[node].add(uid)
+            for clq, sep in links:
+                self._tree_add_edge(uid, clq, sep)
+        elif op == 'link':
+            _, clq1, clq2, old_sep = entry
+            self._tree_remove_edge(clq1, clq2)
+            if old_sep is not None:
+                self._tree_add_edge(clq1, clq2, old_sep)
+        elif op == 'cut':
+            _, clq1, clq2, sep = entry
+            self._tree_add_edge(clq1, clq2, sep)
+        elif op == 'add_node':
+            self.G.remove_node(entry[1])
+            if self._vertex_bits is not None:
+                self._vertex_bits.release(entry[1])
+        elif op == 'remove_node':
+            self.G.add_node(entry[1])
+            self.node_in_cliques[entry[1]] = set()
+        elif op == 'add_edge':
+            self.G.remove_edge(entry[1], entry[2])
+        elif op == 'remove_edge':
+            self.G.add_edge(entry[1], entry[2])
+        elif op == 'add_insertable':
+            self._remove_insertable(entry[1], entry[2])
+        elif op == 'remove_insertable':
+            self._add_insertable(entry[1], entry[2])
+        elif op == 'reset_insertable':
+            self.insertable, self._insertable_nbrs = entry[1], entry[2]
+        elif op == 'add_deletable':
+            self.deletable.discard(entry[1])
+            del self._deletable_clique[entry[1]]
+        elif op == 'remove_deletable':
+            self.deletable.add(entry[1])
+            self._deletable_clique[entry[1]] = entry[2]
+        elif op == 'move_deletable':
+            self._deletable_clique[entry[1]] = entry[2]
+        elif op == 'reset_deletable':
+            (self.deletable, self._track_deletable,
+             self._deletable_clique) = entry[1:]
+        elif op == 'reset':
+            (self.G, self.cliquetree, self.node_in_cliques,
+             self.nodes_in_clique) = entry[1:]
+            self._bits_in_clique = {}
+            self._recount_cliques()
+            self._reindex_separators()
+
+    def enable_stats(self, callback=None):
+        """Starts counting and timing the work done by every edge update,
+        and returns the Stats object that keeps the counters. If callback is
+        given, it is called after every update with a dict of its counters.
+
+        While the stats are disabled, which is the default, they cost a check
+        per operation.
+        """
+        self.stats = Stats(callback)
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
 
     def add_edge(self, x, y, update_insertable=True):
         """Adds an edge to the clique tree and updates the data structures.
+
+        Returns True if the edge was added, False if adding it would break
+        the chordality of the graph and None if it is already in the graph.
         """
+        stats = self.stats
+        if stats is None or not stats.begin('add_edge', x, y):
+            return self._add_edge(x, y, update_insertable)
+        result = None
+        try:
+            result = self._add_edge(x, y, update_insertable)
+        finally:
+            stats.end(result is True, len(self.insertable))
+        return result
+
+    def _add_edge(self, x, y, update_insertable):
         # Start by checking if the edge can be inserted
         # if not self.query_edge(e):
         #   return False
-        if self._edge(x, y) in self.G.edges():
+        if self.G.has_edge(x, y):
             return
-        if x in self.G:
-            neighbors_x = set(self.G[x])
-        else:
-            neighbors_x = set()
-            self.G.add_node(x)
-        if y in self.G:
-            neighbors_y = set(self.G[y])
-        else:
-            neighbors_y = set()
-            self.G.add_node(y)
+        neighbors_x = set(self.G[x]) if x in self.G else set()
+        neighbors_y = set(self.G[y]) if y in self.G else set()
 
         K1 = None
         if x in self.node_in_cliques:
@@ -96,80 +558,67 @@ class CliqueTree:
                 break
 
         changed_edges = []
+        # nodes whose insertable edges may change, see _mark_affected
+        common = neighbors_x.intersection(neighbors_y)
+        merged = None
 
         if (K1 and not K2) or (not K1 and K2):
             self._add_clique_node(self.uid, neighbors_x.intersection(neighbors_y).union(set([x, y])))
-            if K1 and not K2:
-                sep = self.nodes_in_clique[K1]\
+            K = K1 if K1 else K2
+            if self.nodes_in_clique[K] <= self.nodes_in_clique[self.uid]:
+                # K only held the isolated endpoint, so it is not maximal
+                # anymore and the new clique replaces it
+                self._replace_clique(K, self.uid)
+            else:
+                sep = self.nodes_in_clique[K]\
                           .intersection(self.nodes_in_clique[self.uid])
-                self.cliquetree.add_edge(K1, self.uid, nodes=sep)
-                changed_edges.append((K1, self.uid))
-            elif not K1 and K2:
-                sep = self.nodes_in_clique[K2]\
-                          .intersection(self.nodes_in_clique[self.uid])
-                self.cliquetree.add_edge(K2, self.uid, nodes=sep)
-                changed_edges.append((K2, self.uid))
+                self._link(K, self.uid, sep)
+                changed_edges.append((K, self.uid))
         elif K1 and K2:
             Kx = None
             Ky = None
             # figure out Kx and Ky
+            if self.stats is not None:
+                start = timer()
             try:
-                path = nx.shortest_path(self.cliquetree, source=K1, target=K2)
-                min_edge_weight = 1e100
-                min_edge = None
-                first_node = True
-                found_Kx = False
-                for clq1, clq2 in zip(path[:-1], path[1:]):
-                    if first_node:
-                        if x in self.nodes_in_clique[clq1]:
-                            Kx = clq1
-                        first_node = False
-                    if not Ky:
-                        if y in self.nodes_in_clique[clq2]:
-                            Ky = clq2
-                        if x in self.nodes_in_clique[clq2]:
-                            Kx = clq2
-                        else:
-                            # first time to not find x in clq2, Kx = clq1
-                            found_Kx = True
-                    if found_Kx:
-                        sep = self.cliquetree[clq1][clq2]['nodes']
-                        if len(sep) < min_edge_weight:
-                            min_edge_weight = len(sep)
-                            min_edge = (clq1, clq2)
-                    if found_Kx and Ky:
-                        break
+                Kx, Ky, min_edge_weight, min_edge = \
+                    self._path_min_separator(x, y, K1, K2)
             except NetworkXNoPath:
                 # The two nodes belong to disconnected components, so it
                 # is safe to add the edge.
-                # sep = self.nodes_in_clique[K1]\
-                          # .intersection(self.nodes_in_clique[K2])
-                # self.cliquetree.add_edge(K1, K2, nodes=sep)
-                # changed_edges.append((K1, K2))
                 Kx = K1
                 Ky = K2
                 min_edge_weight = 0
+                # the components are only walked if _mark_affected needs
+                # them, before the clique tree joins them
+                if update_insertable and self._tracks_insertable():
+                    merged = (self._component_nodes(K1),
+                              self._component_nodes(K2))
+            if self.stats is not None:
+                self.stats.add_time('path_time', start)
             Kx_nodes = self.nodes_in_clique[Kx]
             Ky_nodes = self.nodes_in_clique[Ky]
             I = Kx_nodes.intersection(Ky_nodes)
-            if Ky not in self.cliquetree[Kx]:
+            if not self.cliquetree.has_edge(Kx, Ky):
                 if min_edge_weight > len(I):
                     return False
 
-            if Ky in self.cliquetree[Kx] or (min_edge_weight == len(I) and
-                    Ky not in self.cliquetree[Kx] and min_edge_weight > 0):
+            if self.cliquetree.has_edge(Kx, Ky) or (
+                    min_edge_weight == len(I) and
+                    not self.cliquetree.has_edge(Kx, Ky) and
+                    min_edge_weight > 0):
                 # replace min_edge with (Kx, Ky)
-                self.cliquetree.remove_edge(*min_edge)
+                self._cut(*min_edge)
                 c1, c2 = self._edge(Kx, Ky)
-                self.cliquetree.add_edge(c1, c2, nodes=I)
+                self._link(c1, c2, I)
 
             # Step 2
             # Add the cliquetree node now, because we might have aborted above
             self._add_clique_node(self.uid,
                                   I.union(set([x, y])))
             edge_to_remove = self._edge(Kx, Ky)
-            if Ky in self.cliquetree[Kx]:
-                self.cliquetree.remove_edge(*edge_to_remove)
+            if self.cliquetree.has_edge(Kx, Ky):
+                self._cut(*edge_to_remove)
 
             to_remove = []
             to_keep = []
@@ -182,22 +631,19 @@ class CliqueTree:
 
             for clq in to_remove:
                 # clq is not maximal in the new graph
-                for v in self.cliquetree[clq]:
+                for v in list(self.cliquetree.neighbors(clq)):
                     if v == self.uid or v in [Kx, Ky]:
                         continue
                     sep = self.nodes_in_clique[v]\
                               .intersection(self.nodes_in_clique[self.uid])
-                    self.cliquetree.add_edge(v, self.uid, nodes=sep)
-                    c1, c2 = self._edge(v, clq)
-                self.cliquetree.remove_node(clq)
-                del self.nodes_in_clique[clq]
-                for v in self.node_in_cliques:
-                    if clq in self.node_in_cliques[v]:
-                        self.node_in_cliques[v].remove(clq)
+                    # cut first, so that the tree never has a cycle
+                    self._cut(v, clq)
+                    self._link(v, self.uid, sep)
+                self._remove_clique_node(clq)
             for clq in to_keep:
                 sep = self.nodes_in_clique[clq]\
                           .intersection(self.nodes_in_clique[self.uid])
-                self.cliquetree.add_edge(clq, self.uid, nodes=sep)
+                self._link(clq, self.uid, sep)
                 changed_edges.append((clq, self.uid))
 
         else:
@@ -206,17 +652,352 @@ class CliqueTree:
                                   neighbors_x.intersection(neighbors_y)
                                       .union(set([x, y])))
 
-        # Update the actual graph
-        self.G.add_edge(x, y)
+        # Update the actual graph, now that the edge has been accepted
+        for node in (x, y):
+            if node not in self.G:
+                self._graph_add_node(node)
+        self._graph_add_edge(x, y)
+        if self._track_deletable:
+            self._refresh_deletable()
         # if (x, y) in self.insertable:
         #     self.insertable.remove((x, y))
 
         self.uid += 1
-        self.insertable = set()
         if update_insertable:
+            self._mark_affected(set([x, y]), common, merged=merged)
+            if not self._deferred:
+                self._flush_insertable()
+        else:
+            self._clear_insertable()
+        return True
+
+    def add_node(self, v, neighbors=(), update_insertable=True):
+        """Adds the node v, connected to the given nodes of the graph, and
+        updates the data structures in one step.
+
+        The graph stays chordal only if the neighbors form a clique, which
+        makes v simplicial; otherwise a ValueError is raised. The new clique
+        of v either extends a clique that contains the neighbors, or hangs
+        from it in the clique tree. Only the insertable edges of v change.
+        """
+        stats = self.stats
+        if stats is None or not stats.begin('add_node', v, None):
+            return self._add_node(v, neighbors, update_insertable)
+        accepted = False
+        try:
+            self._add_node(v, neighbors, update_insertable)
+            accepted = True
+        finally:
+            stats.end(accepted, len(self.insertable))
+
+    def _add_node(self, v, neighbors, update_insertable):
+        if v in self.G:
+            raise ValueError('Node %s is already in the graph.' % (v, ))
+        neighbors = set(neighbors)
+        for u in neighbors:
+            if u not in self.node_in_cliques:
+                raise ValueError('Node %s was not found in the graph.' %
+                                 (u, ))
+        nodes = neighbors.union([v])
+        if not neighbors:
+            self._add_clique_node(self.uid, nodes)
+        else:
+            cliques = set.intersection(*[self.node_in_cliques[u]
+                                         for u in neighbors])
+            if not cliques:
+                raise ValueError('The neighbors of %s do not form a clique.'
+                                 % (v, ))
+            K = min(cliques)
+            self._add_clique_node(self.uid, nodes)
+            if len(self.nodes_in_clique[K]) == len(neighbors):
+                # K is not maximal anymore, the new clique replaces it
+                self._replace_clique(K, self.uid)
+            else:
+                self._link(K, self.uid, neighbors)
+        self.uid += 1
+        self._graph_add_node(v)
+        for u in neighbors:
+            self._graph_add_edge(u, v)
+        if self._track_deletable:
+            self._refresh_deletable()
+        if update_insertable:
+            self._mark_affected(set([v]), set())
+            if not self._deferred:
+                self._flush_insertable()
+        else:
+            self._clear_insertable()
+
+    def remove_node(self, v, update_insertable=True):
+        """Removes the node v and its edges, which always keeps the graph
+        chordal, and updates the data structures.
+
+        The edges of v are removed with remove_edge, each one when it belongs
+        to a single clique; such an edge always exists, in a leaf of the
+        subtree of the cliques of v. The insertable edges are updated once,
+        at the end.
+        """
+        stats = self.stats
+        if stats is None or not stats.begin('remove_node', v, None):
+            return self._remove_node(v, update_insertable)
+        accepted = False
+        try:
+            self._remove_node(v, update_insertable)
+            accepted = True
+        finally:
+            stats.end(accepted, len(self.insertable))
+
+    def _remove_node(self, v, update_insertable):
+        if v not in self.G:
+            raise ValueError('Node %s was not found in the graph.' % (v, ))
+        deferred = self._deferred
+        self._deferred = True
+        try:
+            while self.G[v]:
+                for u in list(self.G[v]):
+                    if len(self.node_in_cliques[u].intersection(
+                            self.node_in_cliques[v])) == 1:
+                        self._remove_edge(u, v, update_insertable)
+        finally:
+            self._deferred = deferred
+        for clq in list(self.node_in_cliques.get(v, ())):
+            self._remove_clique_node(clq)
+        if v not in self.node_in_cliques:
+            self.node_in_cliques[v] = set()
+        self._graph_remove_node(v)
+        if update_insertable:
+            self._discard_insertable(v)
+            if not self._deferred:
+                self._flush_insertable()
+        else:
+            self._clear_insertable()
+
+    def add_edges_from(self, edges):
+        """Adds a batch of edges and updates the insertable edges once, after
+        all of them have been added, only for the affected nodes.
+
+        Returns the list of edges that were rejected, because adding them
+        would break the chordality of the graph.
+        """
+        rejected = []
+        self._deferred = True
+        try:
+            for x, y in edges:
+                if self.add_edge(x, y) is False:
+                    rejected.append((x, y))
+        finally:
+            self._deferred = False
+            self._flush_insertable()
+        return rejected
+
+    def _path_min_separator(self, x, y, K1, K2):
+        """Walks the clique tree path from K1, a clique of x, to K2, a clique
+        of y.
+
+        Returns Kx, the last clique on the path that contains x, Ky, the first
+        one that contains y, and the weight and the edge of the lightest
+        separator between them. Raises NetworkXNoPath if K1 and K2 are in
+        different components of the clique tree.
+        """
+        if self.path_index:
+            return self.cliquetree.path_min_separator(x, y, K1, K2)
+        path = self._tree_path(K1, K2)
+        if self.stats is not None:
+            self.stats.count('path_length', len(path) - 1)
+        Kx = None
+        Ky = None
+        min_edge_weight = 1e100
+        min_edge = None
+        first_node = True
+        found_Kx = False
+        for clq1, clq2 in zip(path[:-1], path[1:]):
+            if first_node:
+                if x in self.nodes_in_clique[clq1]:
+                    Kx = clq1
+                first_node = False
+            if not Ky:
+                if y in self.nodes_in_clique[clq2]:
+                    Ky = clq2
+                if x in self.nodes_in_clique[clq2]:
+                    Kx = clq2
+                else:
+                    # first time to not find x in clq2, Kx = clq1
+                    found_Kx = True
+            if found_Kx:
+                w_e = self._separator_size(clq1, clq2)
+                if w_e < min_edge_weight:
+                    min_edge_weight = w_e
+                    min_edge = (clq1, clq2)
+            if found_Kx and Ky:
+                break
+        return Kx, Ky, min_edge_weight, min_edge
+
+    def _component_nodes(self, clq):
+        """Returns the graph nodes in the connected component of the clique
+        tree that contains clq.
+        """
+        nodes = set(self.nodes_in_clique[clq])
+        for _, clq2, direction in self._dfs_tree_edges(clq):
+            if direction == 'forward':
+                nodes.update(self.nodes_in_clique[clq2])
+        return nodes
+
+    def _dfs_tree_edges(self, source):
+        """Yields the edges of a depth-first traversal of the clique tree that
+        starts at source.
+
+        Each tree edge is reported twice, as (parent, child, 'forward') when
+        the traversal descends into child and as (parent, child, 'reverse')
+        when it backtracks from it.
+        """
+        visited = set([source])
+        stack = [(source, self.cliquetree.neighbors(source))]
+        while stack:
+            parent, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    yield parent, child, 'forward'
+                    stack.append((child, self.cliquetree.neighbors(child)))
+                    break
+            else:
+                stack.pop()
+                if stack:
+                    yield stack[-1][0], parent, 'reverse'
+
+    def _add_insertable(self, u, v):
+        e = self._edge(u, v)
+        if e in self.insertable:
+            return
+        if self._undo_log is not None:
+            self._undo_log.append(('add_insertable', u, v))
+        self.insertable.add(e)
+        self._insertable_nbrs.setdefault(u, set()).add(v)
+        self._insertable_nbrs.setdefault(v, set()).add(u)
+
+    def _remove_insertable(self, u, v):
+        if self._undo_log is not None:
+            self._undo_log.append(('remove_insertable', u, v))
+        self.insertable.discard(self._edge(u, v))
+        self._insertable_nbrs[u].discard(v)
+        self._insertable_nbrs[v].discard(u)
+
+    def _discard_insertable(self, v):
+        """Removes all the insertable edges that have v as an endpoint."""
+        for u in list(self._insertable_nbrs.get(v, ())):
+            self._remove_insertable(u, v)
+
+    def _reset_insertable(self):
+        """Replaces the insertable edges with an empty set."""
+        if self._undo_log is not None:
+            self._undo_log.append(('reset_insertable', self.insertable,
+                                   self._insertable_nbrs))
+        self.insertable = set()
+        self._insertable_nbrs = {}
+
+    def _clear_insertable(self):
+        self._reset_insertable()
+        self._insertable_valid = False
+        self._pending_nodes = set()
+        self._pending_common = set()
+
+    def _tracks_insertable(self):
+        """Returns True if the insertable edges are complete and updated
+        incrementally, so that _mark_affected records the affected nodes.
+        """
+        return self.incremental and self._insertable_valid
+
+    def _mark_affected(self, endpoints, common, merged=None, split=None):
+        """Records the nodes whose insertable edges may have changed after the
+        edge between the two endpoints was added or removed. They are
+        recomputed by _flush_insertable.
+
+        Adding or removing (x, y) only changes the neighborhoods of x and y.
+        For any other pair (u, w), the edge is insertable iff the common
+        neighbors S of u and w separate them. If x and y lie in the same
+        component, every s in S that is affected by the update is adjacent to
+        all the nodes of a chordless u-w path through (x, y), so s is a common
+        neighbor of x and y, and u, w are neighbors of s. Hence only the
+        endpoints and the neighbors of `common`, the common neighbors of x
+        and y, need to be recomputed.
+
+        When the update joins two components, given as the node sets in
+        `merged`, all the edges across them stop being insertable and are
+        dropped right away. When it splits a component in two, given in
+        `split`, all the edges across them become insertable.
+        """
+        if not self._tracks_insertable():
+            return
+        self._pending_nodes.update(endpoints)
+        self._pending_common.update(common)
+        if merged is not None:
+            nodes1, nodes2 = merged
+            if len(nodes1) > len(nodes2):
+                nodes1, nodes2 = nodes2, nodes1
+            for u in nodes1:
+                for w in list(self._insertable_nbrs.get(u, ())):
+                    if w in nodes2:
+                        self._remove_insertable(u, w)
+        if split is not None:
+            self._pending_nodes.update(min(split, key=len))
+
+    def _flush_insertable(self):
+        """Recomputes the insertable edges of the nodes recorded by
+        _mark_affected, or of all the nodes if the insertable edges are not
+        known to be complete.
+        """
+        if self.stats is not None:
+            start = timer()
+        affected = self._pending_nodes
+        common = self._pending_common
+        self._pending_nodes = set()
+        self._pending_common = set()
+        if not self.incremental or not self._insertable_valid:
+            self._recompute_insertable()
+        else:
+            for s in common:
+                for clq in self.node_in_cliques.get(s, ()):
+                    affected.update(self.nodes_in_clique[clq])
+            for v in affected:
+                self._discard_insertable(v)
+            for v in affected:
+                if v in self.node_in_cliques:
+                    self.update_insertable(v)
+        if self.stats is not None:
+            self.stats.add_time('insertable_time', start)
+
+    def _recompute_insertable(self):
+        """Computes all the insertable edges from scratch, with a pool of
+        self.processes worker processes if it is not 1.
+        """
+        self._reset_insertable()
+        if self.processes == 1 or len(self.G) < 2:
             for v in self.G:
                 self.update_insertable(v)
-        return True
+        else:
+            for u, v in _parallel_insertable(self._snapshot(), list(self.G),
+                                             self.processes):
+                self._add_insertable(u, v)
+        self._insertable_valid = True
+
+    def _snapshot(self):
+        """Returns a read-only view of the graph for the worker processes of
+        _recompute_insertable, with a compact clique tree and without the
+        insertable edges. It shares the graph and the cliques with self.
+        """
+        snapshot = CliqueTree(backend='compact', bitsets=self.bitsets)
+        snapshot.G = self.G
+        snapshot.node_in_cliques = self.node_in_cliques
+        snapshot.nodes_in_clique = self.nodes_in_clique
+        if self.backend == 'compact' and not self.path_index:
+            snapshot.cliquetree = self.cliquetree
+        else:
+            snapshot.cliquetree = CompactCliqueTree(self.nodes_in_clique)
+            for clq in self.cliquetree:
+                snapshot.cliquetree.add_node(clq)
+            for clq1, clq2 in self.cliquetree.edges():
+                snapshot.cliquetree.add_edge(
+                    clq1, clq2, nodes=self._separator(clq1, clq2))
+        return snapshot
 
     def update_insertable(self, v, stop_at=None):
         """Updates the insertable edges in the graph.
@@ -224,54 +1005,95 @@ class CliqueTree:
         For early stopping, set stop_at to k. Then, the function will return
         after when k edges have been added to the insertable set.
         """
+        cliques_visited = set()
+        for u in self._insertable_partners(v, cliques_visited):
+            self._add_insertable(u, v)
+            if stop_at is not None and len(self.insertable) >= stop_at:
+                break
+        if self.stats is not None:
+            self.stats.count('update_insertable')
+            self.stats.count('dfs_edges', len(cliques_visited) - 1)
+
+    def iter_insertable(self, v):
+        """Yields the insertable edges of v, as pairs (v, u), one at a time.
+
+        The edges are found in the order of a depth-first search of the
+        clique tree from a clique of v, followed by the edges to the other
+        components. Unlike update_insertable, it neither uses nor changes the
+        insertable edges, so the caller can stop at any point, e.g. after k
+        edges, for the cost of the search so far. The graph must not change
+        while iterating.
+        """
+        if v not in self.node_in_cliques:
+            return
+        for u in self._insertable_partners(v, set()):
+            yield v, u
+
+    def iter_insertable_all(self):
+        """Yields every insertable edge of the graph once, as a pair (u, v)
+        with u < v, one at a time. See iter_insertable.
+        """
+        for v in list(self.node_in_cliques):
+            for u in self._insertable_partners(v, set()):
+                if v < u:
+                    yield v, u
+
+    def _insertable_partners(self, v, cliques_visited):
+        """Yields the nodes u such that (u, v) is insertable, each one once,
+        and adds the cliques that it visits to cliques_visited.
+        """
         K1 = 0
         Kx = None
-        cliques_visited = set()
-        nodes_seen = []
+        bits = self._vertex_bits
+        # the nodes of the cliques on the path from Kx, with the nodes that
+        # each clique added to them, so that they are removed on the way back
+        seen = set() if bits is None else 0
+        added = []
         min_weights = []
         v_cliques = self.node_in_cliques[v]
         for clq in self.node_in_cliques[v]:
             K1 = clq
             break
         cliques_visited.add(K1)
-        for clq1, clq2, data in \
-                nx.dfs_labeled_edges(self.cliquetree, source=K1):
-            if data['dir'] is 'nontree' or (clq1 == K1 and clq2 == K1):
-                continue
-            clq_min, clq_max = self._edge(clq1, clq2)
-            sep = self.cliquetree[clq_min][clq_max]['nodes']
-            if data['dir'] is 'forward':
+        for clq1, clq2, direction in self._dfs_tree_edges(K1):
+            if direction == 'forward':
                 cliques_visited.add(clq2)
                 if clq1 in v_cliques and clq2 not in v_cliques:
                     Kx = clq1
                     Kx_nodes = self.nodes_in_clique[clq1]
+                    if bits is not None:
+                        Kx_bits = self._clique_bits(Kx)
                 if Kx:
-                    w_e = len(sep)
-                    if not min_weights or w_e <= min_weights[-1]:
-                        # w(e) = w(x, y)
-                        min_weights.append(w_e)
-                        # is it a possible Ky?
-                        Ky_nodes = self.nodes_in_clique[clq2]
-                        if min_weights[-1] == len(Kx_nodes.intersection(Ky_nodes)):
-                            for u in self.nodes_in_clique[clq2]:
-                                if (not nodes_seen or u not in nodes_seen[-1]) \
-                                        and u not in self.G[v] and u != v:
-                                    # Ky for u
-                                    self.insertable.add(self._edge(u, v))
-                                    if u == v:
-                                        raise ValueError('u is equal to v')
-                                    if stop_at is not None and \
-                                            len(self.insertable) >= stop_at:
-                                        return
+                    w_e = self._separator_size(clq1, clq2)
+                    if min_weights and min_weights[-1] < w_e:
+                        w_e = min_weights[-1]
+                    # w(e) = w(x, y), the lightest separator on the path
+                    min_weights.append(w_e)
+                    # is it a possible Ky?
+                    Ky_nodes = self.nodes_in_clique[clq2]
+                    if bits is None:
+                        I_size = len(Kx_nodes.intersection(Ky_nodes))
                     else:
-                        min_weights.append(min_weights[-1])
-                    if nodes_seen:
-                        seen_previous = nodes_seen[-1]
+                        Ky_bits = self._clique_bits(clq2)
+                        I_size = popcount(Kx_bits & Ky_bits)
+                    if w_e == I_size:
+                        for u in Ky_nodes:
+                            if bits is None:
+                                was_seen = u in seen
+                            else:
+                                was_seen = bits.contains(seen, u)
+                            if not was_seen and u not in self.G[v] and \
+                                    u != v:
+                                # Ky for u
+                                yield u
+                    if bits is None:
+                        new_nodes = Ky_nodes.difference(seen)
+                        seen.update(new_nodes)
                     else:
-                        seen_previous = set()
-                    nodes_seen.append(self.nodes_in_clique[clq2]
-                                          .union(seen_previous))
-            elif data['dir'] is 'reverse':
+                        new_nodes = Ky_bits & ~seen
+                        seen |= new_nodes
+                    added.append(new_nodes)
+            elif direction == 'reverse':
                 first_Kx = False
                 if clq1 in v_cliques and clq2 not in v_cliques:
                     Kx = None
@@ -279,57 +1101,184 @@ class CliqueTree:
                     first_Kx = True
                 if Kx is not None or first_Kx:
                     min_weights.pop()
-                    nodes_seen.pop()
+                    if bits is None:
+                        seen.difference_update(added.pop())
+                    else:
+                        seen ^= added.pop()
         for clq in self.cliquetree:
             # if clique is in another component, edge is insertable
             if clq not in cliques_visited:
                 for u in self.nodes_in_clique[clq]:
-                    self.insertable.add(self._edge(u, v))
-                    if stop_at is not None and \
-                            len(self.insertable) >= stop_at:
-                        return
+                    # only from one of the cliques of u
+                    if clq == min(self.node_in_cliques[u]):
+                        yield u
 
     def update_deletable(self):
+        """Computes the deletable edges, i.e. the edges that belong to exactly
+        one maximal clique and can be removed without breaking chordality.
+
+        From then on, add_edge and remove_edge keep them up to date.
+        """
+        if self._undo_log is not None:
+            self._undo_log.append(('reset_deletable', self.deletable,
+                                   self._track_deletable,
+                                   self._deletable_clique))
         self.deletable = set()
-        for u_index, u in enumerate(self.G):
-            for v_index, v in enumerate(self.G):
-                if u_index >= v_index:
-                    continue
-                if self._edge(u, v) in self.deletable:
-                    continue
-                clq_u = self.node_in_cliques[u]
-                clq_v = self.node_in_cliques[v]
-                if len(clq_u.intersection(clq_v)) == 1:
-                    self.deletable.add(self._edge(u, v))
+        self._deletable_clique = {}
+        self._track_deletable = True
+        self._dirty_cliques = []
+        for u, v in self.G.edges():
+            clq = self._single_clique(u, v)
+            if clq is not None:
+                e = self._edge(u, v)
+                self.deletable.add(e)
+                self._deletable_clique[e] = clq
 
-    def from_graph(self, G):
-        self.G = G.copy()
-        cliques = nx.clique.find_cliques(G)
-        cliquegraph = nx.clique.make_max_clique_graph(G)
-        clique_dict = {}
-        for v, clq in zip(cliquegraph.nodes(), cliques):
-            clique_dict[v] = clq
-
-        for u, v, data in cliquegraph.edges(data=True):
-            cliquegraph.remove_edge(u, v)
-            sep = set(clique_dict[u]).intersection(set(clique_dict[v]))
-            w = len(sep)
-            cliquegraph.add_edge(u, v, nodes=sep, weight=-w)
-        self.cliquetree = nx.minimum_spanning_tree(cliquegraph)
+    def _single_clique(self, u, v):
+        """Returns the only clique that contains both u and v, or None if
+        there is no such clique or more than one."""
+        cliques_u = self.node_in_cliques.get(u, ())
+        cliques_v = self.node_in_cliques.get(v, ())
+        if len(cliques_u) > len(cliques_v):
+            cliques_u, cliques_v = cliques_v, cliques_u
+        found = None
+        for clq in cliques_u:
+            if clq in cliques_v:
+                if found is not None:
+                    return None
+                found = clq
+        return found
+
+    def _refresh_deletable(self):
+        """Updates the deletable edges after an edge update.
+
+        The number of cliques that contain an edge only changes if one of
+        them was created or removed, so only the pairs of nodes inside those
+        cliques are checked.
+        """
+        if self.stats is not None:
+            start = timer()
+        dirty = self._dirty_cliques
+        self._dirty_cliques = []
+        checked = set()
+        for nodes in dirty:
+            nodes = list(nodes)
+            for i, u in enumerate(nodes):
+                for v in nodes[i + 1:]:
+                    e = self._edge(u, v)
+                    if e in checked:
+                        continue
+                    checked.add(e)
+                    clq = None
+                    if self.G.has_edge(u, v):
+                        clq = self._single_clique(u, v)
+                    old = self._deletable_clique.get(e)
+                    if clq == old:
+                        continue
+                    if clq is not None and old is None:
+                        if self._undo_log is not None:
+                            self._undo_log.append(('add_deletable', e))
+                        self.deletable.add(e)
+                    elif clq is None:
+                        if self._undo_log is not None:
+                            self._undo_log.append(('remove_deletable', e,
+                                                   old))
+                        self.deletable.discard(e)
+                        del self._deletable_clique[e]
+                        continue
+                    elif self._undo_log is not None:
+                        # the edge is in a new clique, that replaced its old
+                        # one
+                        self._undo_log.append(('move_deletable', e, old))
+                    self._deletable_clique[e] = clq
+        if self.stats is not None:
+            self.stats.add_time('deletable_time', start)
+
+    def from_graph(self, G, update_insertable=True):
+        """Builds the clique tree of a chordal graph G in O(n + m), using a
+        maximum cardinality search, and computes its insertable edges.
 
+        Computing the insertable edges takes O(n) searches of the clique
+        tree; with update_insertable=False they are left out, as in
+        add_edge, and computed by the next update that maintains them.
+
+        Raises ValueError if G is not chordal.
+        """
+        order, earlier = _maximum_cardinality_search(G)
+        position = dict((v, i) for i, v in enumerate(order))
+        cliques = []  # the nodes of each clique, clique i has id i + 1
+        tree_edges = []
+        clique_of = {}
+        previous = None
+        for v in order:
+            madj = earlier[v]
+            last = None
+            if madj:
+                last = max(madj, key=position.get)
+                # G is chordal iff the earlier neighbors of every node are a
+                # clique, i.e. all but the last one precede the last one
+                for u in madj:
+                    if u != last and u not in earlier[last]:
+                        raise ValueError('The graph is not chordal.')
+            if previous is None or len(madj) <= len(earlier[previous]):
+                # v starts a new clique, a child of the clique of last
+                cliques.append(set(madj))
+                if last is not None:
+                    tree_edges.append((clique_of[last], len(cliques),
+                                       set(madj)))
+            cliques[-1].add(v)
+            clique_of[v] = len(cliques)
+            previous = v
+
+        if self._undo_log is not None:
+            self._undo_log.append(('reset', self.G, self.cliquetree,
+                                   self.node_in_cliques,
+                                   self.nodes_in_clique))
+        self.G = G.copy()
+        self.node_in_cliques = {}
+        self.nodes_in_clique = {}
+        self._vertex_bits = VertexBits() if self.bitsets else None
+        self._bits_in_clique = {}
+        self._clique_sizes = {}
+        self.cliquetree = self._new_cliquetree()
         for v in self.G:
             self.node_in_cliques[v] = set()
-        for v in clique_dict:
-            self.nodes_in_clique[v] = set()
-            for node in clique_dict[v]:
-                self.nodes_in_clique[v].add(node)
-                self.node_in_cliques[node].add(v)
-        self.uid = len(G) + 1
-        self.insertable = set()
-        for v in self.G:
-            self.update_insertable(v)
+        for uid, nodes in enumerate(cliques, 1):
+            self._add_clique_node(uid, nodes)
+        self._separators_by_size = {}
+        self._separator_sizes = {}
+        for clq1, clq2, sep in tree_edges:
+            self._tree_add_edge(clq1, clq2, sep)
+        self.uid = len(cliques) + 1
+        self._dirty_cliques = []
+        if self._track_deletable:
+            self.update_deletable()
+        if update_insertable:
+            self._pending_nodes = set()
+            self._pending_common = set()
+            self._recompute_insertable()
+        else:
+            self._clear_insertable()
 
-    def remove_edge(self, u, v):
+    def remove_edge(self, u, v, update_insertable=True):
+        """Removes an edge from the clique tree and updates the data
+        structures.
+
+        Raises ValueError if the edge is not in the graph, or if it belongs to
+        more than one maximal clique, since removing it would break the
+        chordality of the graph.
+        """
+        stats = self.stats
+        if stats is None or not stats.begin('remove_edge', u, v):
+            return self._remove_edge(u, v, update_insertable)
+        accepted = False
+        try:
+            self._remove_edge(u, v, update_insertable)
+            accepted = True
+        finally:
+            stats.end(accepted, len(self.insertable))
+
+    def _remove_edge(self, u, v, update_insertable):
         Kx = self.node_in_cliques[u].intersection(self.node_in_cliques[v])
         if len(Kx) == 0:
             raise ValueError('Edge (%s, %s) was not found in the graph.' %
@@ -348,7 +1297,7 @@ class CliqueTree:
         Nuv = []
         Kux = None
         Kvx = None
-        for clq in self.cliquetree[Kx]:
+        for clq in self.cliquetree.neighbors(Kx):
             found_u = False
             found_v = False
             clq_nodes = self.nodes_in_clique[clq]
@@ -381,44 +1330,540 @@ class CliqueTree:
         for clq in Nu:
             if clq == Kux:
                 continue
-            clq_min, clq_max = self._edge(clq, Kx)
-            sep = self.cliquetree[clq_min][clq_max]['nodes']
-            self.cliquetree.add_edge(clq, Kux, nodes=sep)
+            sep = self._separator(clq, Kx)
+            self._cut(clq, Kx)
+            self._link(clq, Kux, sep)
         for clq in Nv:
             if clq == Kvx:
                 continue
-            clq_min, clq_max = self._edge(clq, Kx)
-            sep = self.cliquetree[clq_min][clq_max]['nodes']
-            self.cliquetree.add_edge(clq, Kvx, nodes=sep)
+            sep = self._separator(clq, Kx)
+            self._cut(clq, Kx)
+            self._link(clq, Kvx, sep)
+
+        # Detach Kx, so that the tree never has a cycle
+        for clq in list(self.cliquetree.neighbors(Kx)):
+            self._cut(clq, Kx)
 
         # Add an edge between Kux and Kvx
+        split = None
         if Kux is not None and Kvx is not None:
             sep = self.nodes_in_clique[Kux]\
                       .intersection(self.nodes_in_clique[Kvx])
             if len(sep) > 0:
                 # the edge deletion will not disconnect the tree
                 clq_min, clq_max = self._edge(Kux, Kvx)
-                self.cliquetree.add_edge(clq_min, clq_max, nodes=sep)
+                self._link(clq_min, clq_max, sep)
+            else:
+                split = (Kux, Kvx)
 
         # Delete Kx
-        self.cliquetree.remove_node(Kx)
-        del self.nodes_in_clique[Kx]
-        for t in self.node_in_cliques:
-            if Kx in self.node_in_cliques[t]:
-                self.node_in_cliques[t].remove(Kx)
-        self.G.remove_edge(u, v)
-        self.insertable = set()
-        for t in self.G:
-            self.update_insertable(t)
+        self._remove_clique_node(Kx)
+        self._graph_remove_edge(u, v)
+        if self._track_deletable:
+            self._refresh_deletable()
+        if update_insertable:
+            common = set(self.G[u]).intersection(self.G[v])
+            if split is not None and self._tracks_insertable():
+                split = (self._component_nodes(split[0]),
+                         self._component_nodes(split[1]))
+            self._mark_affected(set([u, v]), common, split=split)
+            if not self._deferred:
+                self._flush_insertable()
+        else:
+            self._clear_insertable()
+
+    def remove_edges_from(self, edges):
+        """Removes a batch of edges and updates the insertable edges once,
+        after all of them have been removed, only for the affected nodes.
+
+        Returns the list of edges that were rejected, because they belong to
+        more than one maximal clique and removing them would break the
+        chordality of the graph.
+        """
+        rejected = []
+        self._deferred = True
+        try:
+            for u, v in edges:
+                if u in self.node_in_cliques and v in self.node_in_cliques \
+                        and len(self.node_in_cliques[u].intersection(
+                            self.node_in_cliques[v])) > 1:
+                    rejected.append((u, v))
+                    continue
+                self.remove_edge(u, v)
+        finally:
+            self._deferred = False
+            self._flush_insertable()
+        return rejected
+
+    def apply_events(self, events, insertable=False, deletable=False,
+                     deltas=False, flush_every=1):
+        """Applies a stream of edge updates and yields an EventResult for each
+        one of them, as it is applied.
+
+        Every event is a tuple (op, u, v), where op is '+' to add the edge
+        (u, v) and '-' to remove it. Events that would break the chordality
+        of the graph, or that do not change it, are rejected and skipped.
+        Nothing is kept per event, so the stream can be arbitrarily long.
+
+        The insertable edges are not maintained unless insertable is True.
+        Then, their recomputation is deferred and done once every flush_every
+        events, or only at the end of the stream if flush_every is None. With
+        deletable=True the deletable edges are kept up to date as well.
+
+        With deltas=True, each result also carries the edges that became,
+        or stopped being, insertable and deletable during the event. The
+        changes of a deferred recomputation are reported by the event that
+        triggered it.
+        """
+        if deletable and not self._track_deletable:
+            self.update_deletable()
+        count = 0
+        self._deferred = insertable
+        try:
+            for op, u, v in events:
+                count += 1
+                if deltas:
+                    self.checkpoint()
+                    start = len(self._undo_log)
+                if op == '+':
+                    accepted = self.add_edge(
+                        u, v, update_insertable=insertable) is True
+                elif op == '-':
+                    accepted = self.G.has_edge(u, v) and len(
+                        self.node_in_cliques[u]
+                        .intersection(self.node_in_cliques[v])) == 1
+                    if accepted:
+                        self.remove_edge(u, v, update_insertable=insertable)
+                else:
+                    raise ValueError('Unknown edge update: %s' % (op, ))
+                if insertable and flush_every is not None and \
+                        count % flush_every == 0:
+                    self._flush_insertable()
+                changes = (None, None, None, None)
+                if deltas:
+                    changes = self._log_changes(start, insertable, deletable)
+                    self.commit()
+                yield EventResult(op, u, v, accepted, *changes)
+        finally:
+            self._deferred = False
+            if insertable:
+                self._flush_insertable()
+
+    def _log_changes(self, start, insertable, deletable):
+        """Returns the insertable edges added and removed, and the deletable
+        edges added and removed, according to the undo log after start.
+        """
+        added = {'insertable': set(), 'deletable': set()}
+        removed = {'insertable': set(), 'deletable': set()}
+        for entry in self._undo_log[start:]:
+            op = entry[0]
+            if op in ('add_insertable', 'remove_insertable'):
+                changes = [(op == 'add_insertable', 'insertable',
+                            self._edge(entry[1], entry[2]))]
+            elif op in ('add_deletable', 'remove_deletable'):
+                changes = [(op == 'add_deletable', 'deletable', entry[1])]
+            elif op in ('reset_insertable', 'reset_deletable'):
+                # everything in the replaced set is removed
+                kind = op[len('reset_'):]
+                changes = [(False, kind, e) for e in entry[1]]
+            else:
+                continue
+            for add, kind, e in changes:
+                if add:
+                    if e in removed[kind]:
+                        removed[kind].discard(e)
+                    else:
+                        added[kind].add(e)
+                elif e in added[kind]:
+                    added[kind].discard(e)
+                else:
+                    removed[kind].add(e)
+        result = []
+        for kind, enabled in (('insertable', insertable),
+                              ('deletable', deletable)):
+            if enabled:
+                result.extend([added[kind], removed[kind]])
+            else:
+                result.extend([None, None])
+        return result
+
+    def greedy_add_edges(self, score, k=None, min_score=None):
+        """Adds insertable edges greedily, the one of highest score first,
+        and returns the list of edges added, in order.
+
+        score is a function score(u, v) of an edge, or a mapping from edges
+        (u, v), with u < v, to their score; edges that are not in the mapping
+        are never added. It stops after k edges, when the best score is below
+        min_score, or when no insertable edge is left.
+
+        The insertable edges are kept in a heap keyed by their score. After
+        each insertion, only the edges that became insertable are scored and
+        pushed, as read from the undo log of the insertion; the ones that
+        stopped being insertable are dropped when they reach the top.
+        """
+        if not callable(score):
+            weights = score
+
+            def score(u, v):
+                return weights.get(self._edge(u, v))
+        heap = []
+
+        def push(edges):
+            for u, v in edges:
+                w = score(u, v)
+                if w is not None:
+                    heapq.heappush(heap, (-w, u, v))
+        if not self._insertable_valid or self._pending_nodes \
+                or self._pending_common:
+            self._flush_insertable()
+        push(self.insertable)
+        added = []
+        while heap and (k is None or len(added) < k):
+            w, u, v = heapq.heappop(heap)
+            if min_score is not None and -w < min_score:
+                break
+            if (u, v) not in self.insertable:
+                continue
+            self.checkpoint()
+            start = len(self._undo_log)
+            accepted = self.add_edge(u, v)
+            new_edges = self._log_changes(start, True, False)[0]
+            self.commit()
+            if accepted:
+                added.append((u, v))
+                push(new_edges)
+        return added
+
+    def save(self, path):
+        """Saves the graph, its clique tree and the insertable and deletable
+        edges to a file, in the binary format described in storage. The node
+        labels must be int or str.
+        """
+        storage.save(self, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Returns the CliqueTree saved in a file by save().
+
+        The loaded tree is a private copy of the file in the usual data
+        structures. With mmap=True the file is memory-mapped while it is
+        decoded, instead of being read into memory first. To share the pages
+        of the file between processes, use open() instead.
+        """
+        return storage.load(cls, path, use_mmap=mmap)
+
+    @staticmethod
+    def open(path):
+        """Returns a storage.MappedCliqueTree, a read-only view of a file
+        saved by save() that answers queries like query_edge from the
+        memory-mapped file, without building a CliqueTree.
+        """
+        return storage.MappedCliqueTree(path)
+
+    def clique_number(self):
+        """Returns the size of the largest clique of the graph.
+
+        The number of maximal cliques of each size is kept up to date by
+        every update, so this takes time proportional to the number of
+        distinct clique sizes.
+        """
+        return max(self._clique_sizes) if self._clique_sizes else 0
+
+    def treewidth(self):
+        """Returns the treewidth of the graph, i.e. the size of its largest
+        clique minus one, or -1 if the graph is empty. See clique_number.
+        """
+        return self.clique_number() - 1
+
+    def max_clique(self):
+        """Returns the set of nodes of a largest clique of the graph."""
+        if not self.nodes_in_clique:
+            return set()
+        return set(max(self.nodes_in_clique.values(), key=len))
+
+    def clique_sizes(self):
+        """Returns a dict from each clique size to the number of maximal
+        cliques of that size."""
+        return dict(self._clique_sizes)
+
+    def cliques_containing(self, u, w):
+        """Returns the set of the maximal cliques that contain both u and w.
+        """
+        return self.node_in_cliques.get(u, set()).intersection(
+            self.node_in_cliques.get(w, ()))
+
+    def clique_of_edge(self, u, v):
+        """Returns the maximal clique that contains the edge (u, v), or None
+        if the edge is not in the graph or belongs to more than one clique.
+
+        Once update_deletable has been called, the clique of every deletable
+        edge is kept up to date and this is a dict lookup.
+        """
+        if self._track_deletable:
+            return self._deletable_clique.get(self._edge(u, v))
+        if not self.G.has_edge(u, v):
+            return None
+        return self._single_clique(u, v)
+
+    def separator_sizes(self):
+        """Returns a dict from each separator size to the number of clique
+        tree edges with a separator of that size."""
+        return dict((size, len(edges))
+                    for size, edges in self._separators_by_size.items())
+
+    def separators_of_size(self, size):
+        """Returns the clique tree edges whose separator has the given size,
+        as pairs (clq1, clq2) with clq1 < clq2."""
+        return set(self._separators_by_size.get(size, ()))
+
+    def largest_separator(self):
+        """Returns a clique tree edge with the largest separator, as a pair
+        (clq1, clq2) with clq1 < clq2, or None if the tree has no edges.
+
+        The clique tree edges are kept in buckets by the size of their
+        separator, so this takes time proportional to the number of
+        distinct separator sizes.
+        """
+        if not self._separators_by_size:
+            return None
+        return next(iter(self._separators_by_size[
+            max(self._separators_by_size)]))
+
+    def _clique_order(self):
+        """Yields the cliques of every component of the clique tree in
+        depth-first preorder, each one with its parent, or None for the
+        root of a component.
+        """
+        visited = set()
+        for root in self.cliquetree:
+            if root in visited:
+                continue
+            visited.add(root)
+            yield root, None
+            for parent, child, direction in self._dfs_tree_edges(root):
+                if direction == 'forward':
+                    visited.add(child)
+                    yield child, parent
+
+    def perfect_elimination_ordering(self):
+        """Returns a perfect elimination ordering of the graph, as a list of
+        its nodes, in O(n + sum of the clique sizes).
+
+        Listing the nodes of each clique that are not in its parent, in the
+        preorder of the clique tree, places the neighbors of a node that come
+        before it in its first clique; the reverse is a perfect elimination
+        ordering.
+        """
+        order = []
+        for clq, parent in self._clique_order():
+            nodes = self.nodes_in_clique[clq]
+            if parent is None:
+                order.extend(nodes)
+            else:
+                order.extend(nodes - self.nodes_in_clique[parent])
+        order.reverse()
+        return order
+
+    def coloring(self):
+        """Returns an optimal coloring of the graph, as a dict from each node
+        to its color, an integer in range(clique_number()).
+
+        The cliques are colored in the preorder of the clique tree: the nodes
+        of a clique that are not in its parent get the colors that its
+        separator with the parent does not use.
+        """
+        colors = {}
+        for clq, parent in self._clique_order():
+            nodes = self.nodes_in_clique[clq]
+            if parent is not None:
+                nodes = nodes - self.nodes_in_clique[parent]
+            used = set(colors[v] for v in self.nodes_in_clique[clq]
+                       if v in colors)
+            color = 0
+            for v in nodes:
+                while color in used:
+                    color += 1
+                colors[v] = color
+                color += 1
+        return colors
+
+    def maximum_independent_set(self):
+        """Returns a maximum independent set of the graph, computed by
+        picking greedily the nodes of a perfect elimination ordering that are
+        not adjacent to a node picked before (Gavril).
+        """
+        chosen = set()
+        blocked = set()
+        for v in self.perfect_elimination_ordering():
+            if v not in blocked:
+                chosen.add(v)
+                blocked.update(self.G[v])
+        return chosen
 
     def query_edge(self, x, y):
-        e = self._edge(x, y)
-        if not self.insertable or e in self.insertable:
+        """Returns True if the edge (x, y) can be added to the graph.
+
+        Uses the insertable edges when they are up to date and falls back to
+        is_insertable otherwise, e.g. while apply_events defers their
+        recomputation.
+        """
+        if self._insertable_valid and not self._pending_nodes \
+                and not self._pending_common and x in self.G and y in self.G:
+            return self._edge(x, y) in self.insertable
+        return self.is_insertable(x, y)
+
+    def is_insertable(self, x, y):
+        """Returns True if the edge (x, y) can be added to the graph without
+        breaking its chordality.
+
+        The answer is computed directly from the clique tree, by comparing the
+        lightest separator on the path between the cliques of x and y with
+        the size of their intersection, as in add_edge. It does not need, nor
+        update, the insertable edges.
+        """
+        if x == y or self.G.has_edge(x, y):
+            return False
+        if x not in self.node_in_cliques or y not in self.node_in_cliques:
+            # a new node can always be connected
             return True
-        return False
+        K1 = next(iter(self.node_in_cliques[x]))
+        K2 = next(iter(self.node_in_cliques[y]))
+        try:
+            Kx, Ky, min_edge_weight, _ = \
+                self._path_min_separator(x, y, K1, K2)
+        except NetworkXNoPath:
+            return True
+        I = self.nodes_in_clique[Kx].intersection(self.nodes_in_clique[Ky])
+        return min_edge_weight <= len(I)
 
     def _edge(self, x, y):
         return (min(x, y), max(x, y))
 
     def clique_tostr(self, v):
         return ', '.join(map(str, list(self.nodes_in_clique[v])))
+
+
+EventResult = namedtuple('EventResult', [
+    'op', 'u', 'v', 'accepted', 'insertable_added', 'insertable_removed',
+    'deletable_added', 'deletable_removed'])
+EventResult.__doc__ = """Outcome of an edge update applied by
+CliqueTree.apply_events. The insertable and deletable changes are None when
+they are not requested."""
+
+
+class Transaction(object):
+    """A group of updates on a CliqueTree that is kept or undone as a whole.
+
+    It is backed by a checkpoint of the tree, so transactions can be nested
+    with each other and with explicit checkpoints, as long as they are closed
+    in the reverse order they were opened.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.result = None  # set by CliqueTree.try_add_edge
+        self.active = True
+        self._depth = len(tree._checkpoints)
+        tree.checkpoint()
+
+    def _close(self):
+        if not self.active:
+            raise ValueError('The transaction is already closed.')
+        if len(self.tree._checkpoints) != self._depth + 1:
+            raise ValueError('A checkpoint opened inside the transaction '
+                             'has not been closed.')
+        self.active = False
+
+    def commit(self):
+        """Keeps the updates made in the transaction."""
+        self._close()
+        self.tree.commit()
+
+    def rollback(self):
+        """Undoes the updates made in the transaction."""
+        self._close()
+        self.tree.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        return False
+
+
+_worker_tree = None
+
+
+def _init_insertable_worker(tree):
+    global _worker_tree
+    _worker_tree = tree
+
+
+def _insertable_worker(nodes):
+    """Returns the insertable edges of a chunk of nodes of _worker_tree."""
+    tree = _worker_tree
+    tree.insertable = set()
+    tree._insertable_nbrs = {}
+    for v in nodes:
+        tree.update_insertable(v)
+    return list(tree.insertable)
+
+
+def _parallel_insertable(tree, nodes, processes):
+    """Yields the insertable edges of the nodes, computed by a pool of
+    processes that read the given tree."""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    chunksize = max(1, len(nodes) // (4 * processes))
+    pool = multiprocessing.Pool(processes, _init_insertable_worker, (tree, ))
+    try:
+        chunks = [nodes[i:i + chunksize]
+                  for i in range(0, len(nodes), chunksize)]
+        for edges in pool.imap_unordered(_insertable_worker, chunks):
+            for u, v in edges:
+                yield u, v
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def _maximum_cardinality_search(G):
+    """Orders the nodes of G by maximum cardinality search in O(n + m).
+
+    Returns the order and, for every node, the set of its neighbors that
+    precede it in the order.
+    """
+    weight = dict.fromkeys(G, 0)
+    buckets = [set(G)]  # the unnumbered nodes of each weight
+    max_weight = 0
+    order = []
+    earlier = {}
+    while weight:
+        while not buckets[max_weight]:
+            max_weight -= 1
+        v = buckets[max_weight].pop()
+        del weight[v]
+        order.append(v)
+        earlier[v] = set()
+        for u in G[v]:
+            if u in earlier:
+                if u != v:
+                    earlier[v].add(u)
+                continue
+            w = weight[u]
+            buckets[w].remove(u)
+            w += 1
+            weight[u] = w
+            if w == len(buckets):
+                buckets.append(set())
+            buckets[w].add(u)
+            if w > max_weight:
+                max_weight = w
+    return order, earlier
@@ -0,0 +1,189 @@
+from array import array
+
+from networkx import NetworkXError
+
+
+# degree above which a clique also keeps a dict from each neighbor to its
+# position in the arrays, so that lookups do not scan them
+_INDEX_DEGREE = 16
+
+
+class _Clique(object):
+    """Adjacency record of a clique: its neighbors in the clique tree and the
+    size of the separator shared with each one of them.
+
+    Most cliques have a few neighbors, which are found by scanning the
+    arrays. Cliques with more than _INDEX_DEGREE neighbors, like the center
+    of a star, also keep the position of every neighbor in index.
+    """
+    __slots__ = ('nbrs', 'sizes', 'index')
+
+    def __init__(self):
+        self.nbrs = array('l')
+        self.sizes = array('l')
+        self.index = None
+
+    def find(self, nbr):
+        """Returns the position of nbr in nbrs, or -1."""
+        if self.index is not None:
+            return self.index.get(nbr, -1)
+        try:
+            return self.nbrs.index(nbr)
+        except (ValueError, TypeError, OverflowError):
+            return -1
+
+    def append(self, nbr, size):
+        self.nbrs.append(nbr)
+        self.sizes.append(size)
+        if self.index is not None:
+            self.index[nbr] = len(self.nbrs) - 1
+        elif len(self.nbrs) > _INDEX_DEGREE:
+            self.index = dict((clq, i) for i, clq in enumerate(self.nbrs))
+
+    def remove(self, i):
+        """Removes the neighbor at position i, replacing it with the last
+        one."""
+        last = len(self.nbrs) - 1
+        if self.index is not None:
+            del self.index[self.nbrs[i]]
+        if i != last:
+            self.nbrs[i] = self.nbrs[last]
+            self.sizes[i] = self.sizes[last]
+            if self.index is not None:
+                self.index[self.nbrs[i]] = i
+        self.nbrs.pop()
+        self.sizes.pop()
+
+
+class _AdjacencyView(object):
+    """Read-only view of the neighbors of a clique, in the format of the
+    networkx adjacency: tree[c1][c2]['nodes'] is the separator of (c1, c2).
+    """
+    __slots__ = ('_tree', '_clq')
+
+    def __init__(self, tree, clq):
+        self._tree = tree
+        self._clq = clq
+
+    def __iter__(self):
+        return iter(self._tree._cliques[self._clq].nbrs)
+
+    def __len__(self):
+        return len(self._tree._cliques[self._clq].nbrs)
+
+    def __contains__(self, nbr):
+        return self._tree._cliques[self._clq].find(nbr) >= 0
+
+    def __getitem__(self, nbr):
+        if nbr not in self:
+            raise KeyError(nbr)
+        return {'nodes': self._tree.separator(self._clq, nbr)}
+
+
+class CompactCliqueTree(object):
+    """Lightweight clique tree that can replace the networkx graph used by
+    CliqueTree.
+
+    Every clique is an integer id with a slotted record of neighbor ids and
+    separator sizes, kept in arrays. Separators are not stored: the node set
+    of a separator is computed on demand from the cliques it joins, in
+    nodes_in_clique. It supports the part of the networkx Graph API that
+    CliqueTree needs.
+    """
+    __slots__ = ('_cliques', '_nodes')
+
+    def __init__(self, nodes_in_clique):
+        self._cliques = {}
+        self._nodes = nodes_in_clique
+
+    def add_node(self, clq):
+        if clq not in self._cliques:
+            self._cliques[clq] = _Clique()
+
+    def add_edge(self, clq1, clq2, nodes=None):
+        if nodes is None:
+            nodes = self._nodes[clq1].intersection(self._nodes[clq2])
+        self.add_node(clq1)
+        self.add_node(clq2)
+        self._link(clq1, clq2, len(nodes))
+        self._link(clq2, clq1, len(nodes))
+
+    def _link(self, clq1, clq2, size):
+        record = self._cliques[clq1]
+        i = record.find(clq2)
+        if i >= 0:
+            record.sizes[i] = size
+        else:
+            record.append(clq2, size)
+
+    def _unlink(self, clq1, clq2):
+        record = self._cliques[clq1]
+        record.remove(record.find(clq2))
+
+    def remove_edge(self, clq1, clq2):
+        if not self.has_edge(clq1, clq2):
+            raise NetworkXError('The edge %s-%s is not in the graph' %
+                                (clq1, clq2))
+        self._unlink(clq1, clq2)
+        self._unlink(clq2, clq1)
+
+    def remove_node(self, clq):
+        try:
+            record = self._cliques.pop(clq)
+        except KeyError:
+            raise NetworkXError('The node %s is not in the graph.' % (clq, ))
+        for nbr in record.nbrs:
+            self._unlink(nbr, clq)
+
+    def has_node(self, clq):
+        return clq in self._cliques
+
+    def has_edge(self, clq1, clq2):
+        record = self._cliques.get(clq1)
+        return record is not None and record.find(clq2) >= 0
+
+    def neighbors(self, clq):
+        return iter(self._cliques[clq].nbrs)
+
+    def separator_size(self, clq1, clq2):
+        record = self._cliques[clq1]
+        i = record.find(clq2)
+        if i < 0:
+            raise KeyError(clq2)
+        return record.sizes[i]
+
+    def separator(self, clq1, clq2):
+        return self._nodes[clq1].intersection(self._nodes[clq2])
+
+    def nodes(self):
+        return list(self._cliques)
+
+    def edges(self, data=False):
+        for clq1, record in self._cliques.items():
+            for clq2 in record.nbrs:
+                if clq1 < clq2:
+                    if data:
+                        yield clq1, clq2, {'nodes': self.separator(clq1,
+                                                                   clq2)}
+                    else:
+                        yield clq1, clq2
+
+    def number_of_nodes(self):
+        return len(self._cliques)
+
+    def number_of_edges(self):
+        return sum(len(record.nbrs) for record in self._cliques.values()) // 2
+
+    def __getitem__(self, clq):
+        if clq not in self._cliques:
+            raise KeyError(clq)
+        return _AdjacencyView(self, clq)
+
+    def __contains__(self, clq):
+        return clq in self._cliques
+
+    def __iter__(self):
+        return iter(self._cliques)
+
+    def __len__(self):
+        return len(self._cliques)
@@ -0,0 +1,316 @@
+from copy import deepcopy
+
+from networkx import NetworkXNoPath
+
+
+INF = float('inf')
+
+
+class _Node(object):
+    """Node of a link-cut tree, which is also a node of the splay tree that
+    holds its preferred path."""
+    __slots__ = ('key', 'weight', 'left', 'right', 'parent', 'rev', 'best')
+
+    def __init__(self, key, weight):
+        self.key = key
+        self.weight = weight
+        self.left = None
+        self.right = None
+        self.parent = None  # splay tree parent, or path parent for a root
+        self.rev = False  # the children have to be swapped
+        self.best = self  # node of minimum weight in the splay subtree
+
+
+def _is_root(n):
+    p = n.parent
+    return p is None or (p.left is not n and p.right is not n)
+
+
+def _push(n):
+    if n.rev:
+        n.left, n.right = n.right, n.left
+        if n.left is not None:
+            n.left.rev = not n.left.rev
+        if n.right is not None:
+            n.right.rev = not n.right.rev
+        n.rev = False
+
+
+def _update(n):
+    best = n
+    if n.left is not None and n.left.best.weight < best.weight:
+        best = n.left.best
+    if n.right is not None and n.right.best.weight < best.weight:
+        best = n.right.best
+    n.best = best
+
+
+def _rotate(x):
+    p = x.parent
+    g = p.parent
+    if p.left is x:
+        b = x.right
+        p.left = b
+        x.right = p
+    else:
+        b = x.left
+        p.right = b
+        x.left = p
+    if b is not None:
+        b.parent = p
+    if g is not None:
+        if g.left is p:
+            g.left = x
+        elif g.right is p:
+            g.right = x
+    x.parent = g
+    p.parent = x
+    _update(p)
+    _update(x)
+
+
+def _splay(x):
+    ancestors = [x]
+    n = x
+    while not _is_root(n):
+        n = n.parent
+        ancestors.append(n)
+    for n in reversed(ancestors):
+        _push(n)
+    while not _is_root(x):
+        p = x.parent
+        if not _is_root(p):
+            if (p.parent.left is p) == (p.left is x):
+                _rotate(p)
+            else:
+                _rotate(x)
+        _rotate(x)
+
+
+def _access(x):
+    last = None
+    y = x
+    while y is not None:
+        _splay(y)
+        y.right = last
+        _update(y)
+        last = y
+        y = y.parent
+    _splay(x)
+
+
+class LinkCutTree(object):
+    """A forest of weighted nodes, stored as a link-cut tree (Sleator and
+    Tarjan).
+
+    Linking, cutting, rerooting and finding the minimum weight node on the
+    path between two nodes all take O(log n) amortized time.
+    """
+    def __init__(self):
+        self._nodes = {}
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    def add(self, key, weight=INF):
+        self._nodes[key] = _Node(key, weight)
+
+    def remove(self, key):
+        """Removes a node that has no links."""
+        del self._nodes[key]
+
+    def set_weight(self, key, weight):
+        n = self._nodes[key]
+        _access(n)
+        n.weight = weight
+        _update(n)
+
+    def _make_root(self, n):
+        _access(n)
+        n.rev = not n.rev
+
+    def find_root(self, key):
+        n = self._nodes[key]
+        _access(n)
+        _push(n)
+        while n.left is not None:
+            n = n.left
+            _push(n)
+        _splay(n)
+        return n.key
+
+    def connected(self, key1, key2):
+        return self.find_root(key1) == self.find_root(key2)
+
+    def link(self, key1, key2):
+        """Links two nodes of different trees."""
+        n = self._nodes[key1]
+        self._make_root(n)
+        n.parent = self._nodes[key2]
+
+    def cut(self, key1, key2):
+        """Removes the link between two adjacent nodes."""
+        n1 = self._nodes[key1]
+        n2 = self._nodes[key2]
+        self._make_root(n1)
+        _access(n2)
+        n2.left.parent = None
+        n2.left = None
+        _update(n2)
+
+    def _expose(self, key1, key2):
+        """Makes the path from key1 to key2 a preferred path and returns the
+        root of its splay tree, in which key1 comes first."""
+        n2 = self._nodes[key2]
+        self._make_root(self._nodes[key1])
+        _access(n2)
+        return n2
+
+    def path_min(self, key1, key2):
+        """Returns the weight and the key of the node of minimum weight on the
+        path between two nodes."""
+        best = self._expose(key1, key2).best
+        return best.weight, best.key
+
+    def last_on_path(self, key1, key2, pred):
+        """Returns the last node on the path from key1 to key2 that satisfies
+        pred, which must hold on a prefix of the path."""
+        n = self._expose(key1, key2)
+        found = None
+        while n is not None:
+            _push(n)
+            last = n
+            if pred(n.key):
+                found = n
+                n = n.right
+            else:
+                n = n.left
+        _splay(last)
+        return found.key if found is not None else None
+
+    def first_on_path(self, key1, key2, pred):
+        """Returns the first node on the path from key1 to key2 that satisfies
+        pred, which must hold on a suffix of the path."""
+        n = self._expose(key1, key2)
+        found = None
+        while n is not None:
+            _push(n)
+            last = n
+            if pred(n.key):
+                found = n
+                n = n.left
+            else:
+                n = n.right
+        _splay(last)
+        return found.key if found is not None else None
+
+
+class IndexedCliqueTree(object):
+    """Clique tree that keeps a link-cut tree index next to a clique tree
+    backend, and forwards everything else to it.
+
+    Each tree edge (c1, c2) is a node of the index, between c1 and c2,
+    weighted by the size of its separator. This answers the path queries of
+    add_edge in logarithmic time, and stays valid across all the edge
+    swaps, since every change of the clique tree goes through this class.
+    """
+    def __init__(self, tree, nodes_in_clique):
+        self.tree = tree
+        self._nodes = nodes_in_clique
+        self._index = LinkCutTree()
+        for clq in tree:
+            self._index.add(clq)
+        for clq1, clq2 in tree.edges():
+            self._index_edge(clq1, clq2, len(self._nodes[clq1]
+                                             .intersection(self._nodes[clq2])))
+
+    def __deepcopy__(self, memo):
+        return IndexedCliqueTree(deepcopy(self.tree, memo),
+                                 deepcopy(self._nodes, memo))
+
+    def __getstate__(self):
+        # the splay trees are deep chains of nodes, which pickle would
+        # recurse into, so the index is rebuilt when unpickling instead
+        return {'tree': self.tree, 'nodes': self._nodes}
+
+    def __setstate__(self, state):
+        self.__init__(state['tree'], state['nodes'])
+
+    def _edge_key(self, clq1, clq2):
+        return (min(clq1, clq2), max(clq1, clq2))
+
+    def _index_edge(self, clq1, clq2, weight):
+        key = self._edge_key(clq1, clq2)
+        self._index.add(key, weight)
+        self._index.link(clq1, key)
+        self._index.link(key, clq2)
+
+    def _unindex_edge(self, clq1, clq2):
+        key = self._edge_key(clq1, clq2)
+        self._index.cut(clq1, key)
+        self._index.cut(key, clq2)
+        self._index.remove(key)
+
+    def add_node(self, clq):
+        self.tree.add_node(clq)
+        if clq not in self._index:
+            self._index.add(clq)
+
+    def add_edge(self, clq1, clq2, nodes=None):
+        if nodes is None:
+            nodes = self._nodes[clq1].intersection(self._nodes[clq2])
+        exists = self.tree.has_edge(clq1, clq2)
+        self.add_node(clq1)
+        self.add_node(clq2)
+        self.tree.add_edge(clq1, clq2, nodes=nodes)
+        if exists:
+            self._index.set_weight(self._edge_key(clq1, clq2), len(nodes))
+        else:
+            self._index_edge(clq1, clq2, len(nodes))
+
+    def remove_edge(self, clq1, clq2):
+        self.tree.remove_edge(clq1, clq2)
+        self._unindex_edge(clq1, clq2)
+
+    def remove_node(self, clq):
+        for nbr in list(self.tree.neighbors(clq)):
+            self._unindex_edge(clq, nbr)
+        self.tree.remove_node(clq)
+        self._index.remove(clq)
+
+    def _contains(self, v):
+        """Returns a predicate that tells if an index node contains v."""
+        nodes = self._nodes
+
+        def pred(key):
+            if isinstance(key, tuple):
+                return v in nodes[key[0]] and v in nodes[key[1]]
+            return v in nodes[key]
+        return pred
+
+    def path_min_separator(self, x, y, K1, K2):
+        """Same as CliqueTree._path_min_separator, in O(log n) amortized time.
+        """
+        if not self._index.connected(K1, K2):
+            raise NetworkXNoPath('No path between %s and %s.' % (K1, K2))
+        Kx = self._index.last_on_path(K1, K2, self._contains(x))
+        Ky = self._index.first_on_path(K1, K2, self._contains(y))
+        min_edge_weight, min_edge = self._index.path_min(Kx, Ky)
+        return Kx, Ky, min_edge_weight, min_edge
+
+    def __getattr__(self, name):
+        if name == 'tree':
+            raise AttributeError(name)
+        return getattr(self.tree, name)
+
+    def __getitem__(self, clq):
+        return self.tree[clq]
+
+    def __contains__(self, clq):
+        return clq in self.tree
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def __len__(self):
+        return len(self.tree)
@@ -0,0 +1,194 @@
+"""Persistent hash map, for the snapshots of SharedCliqueTree.
+
+The map is a hash trie: every internal node is a list of 32 slots, indexed
+by 5 bits of the hash of the key, and every slot holds nothing, a child, an
+entry (key, value) or, once the 64 bits of the hash are used up, a dict of
+the entries whose hashes collide. Setting or deleting a key copies only the
+nodes on its path, O(log n) of them, and shares the rest with the original
+map, which is never modified.
+"""
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+_HASH_MASK = (1 << 64) - 1
+# below this depth, all the bits of the hash have been used
+_MAX_DEPTH = (64 + _BITS - 1) // _BITS
+
+
+def _hash(key):
+    return hash(key) & _HASH_MASK
+
+
+def _split(entry, entry_hash, key, key_hash, value, depth):
+    """Returns a node at depth, where the hashes are shifted to, that holds
+    the entry and (key, value)."""
+    if depth >= _MAX_DEPTH:
+        return {entry[0]: entry[1], key: value}
+    node = [None] * _WIDTH
+    i = entry_hash & _MASK
+    j = key_hash & _MASK
+    if i != j:
+        node[i] = entry
+        node[j] = (key, value)
+    else:
+        node[i] = _split(entry, entry_hash >> _BITS, key, key_hash >> _BITS,
+                         value, depth + 1)
+    return node
+
+
+def _assoc(node, h, depth, key, value, copy):
+    """Sets key in node, a copy of node if copy is True, and returns the node
+    and True if the key is new."""
+    if copy:
+        node = list(node)
+    i = h & _MASK
+    slot = node[i]
+    added = True
+    if slot is None:
+        node[i] = (key, value)
+    elif type(slot) is list:
+        node[i], added = _assoc(slot, h >> _BITS, depth + 1, key, value,
+                                copy)
+    elif type(slot) is tuple:
+        if slot[0] == key:
+            node[i] = (key, value)
+            added = False
+        else:
+            shift = _BITS * (depth + 1)
+            node[i] = _split(slot, _hash(slot[0]) >> shift, key,
+                             h >> _BITS, value, depth + 1)
+    else:
+        bucket = dict(slot) if copy else slot
+        added = key not in bucket
+        bucket[key] = value
+        node[i] = bucket
+    return node, added
+
+
+def _dissoc(node, h, key):
+    """Returns a copy of node without key, or None if key is not in node.
+    """
+    i = h & _MASK
+    slot = node[i]
+    if slot is None:
+        return None
+    if type(slot) is list:
+        child = _dissoc(slot, h >> _BITS, key)
+        if child is None:
+            return None
+        # a child left with a single entry is replaced by the entry
+        filled = [s for s in child if s is not None]
+        if not filled:
+            child = None
+        elif len(filled) == 1 and type(filled[0]) is tuple:
+            child = filled[0]
+    elif type(slot) is tuple:
+        if slot[0] != key:
+            return None
+        child = None
+    else:
+        if key not in slot:
+            return None
+        child = dict(slot)
+        del child[key]
+        if len(child) == 1:
+            child = next(iter(child.items()))
+    node = list(node)
+    node[i] = child
+    return node
+
+
+def _iter(node):
+    for slot in node:
+        if slot is None:
+            continue
+        if type(slot) is list:
+            for entry in _iter(slot):
+                yield entry
+        elif type(slot) is tuple:
+            yield slot
+        else:
+            for entry in slot.items():
+                yield entry
+
+
+class PersistentMap(Mapping):
+    """Immutable mapping whose set() and delete() return a new map, in
+    O(log n) time, that shares most of its nodes with the old one.
+    """
+    __slots__ = ('_root', '_len')
+
+    def __init__(self, items=()):
+        # the new nodes are not shared yet, so they are filled in place
+        self._root = [None] * _WIDTH
+        self._len = 0
+        if isinstance(items, Mapping):
+            items = items.items()
+        for key, value in items:
+            _, added = _assoc(self._root, _hash(key), 0, key, value, False)
+            self._len += added
+
+    @classmethod
+    def _new(cls, root, length):
+        result = cls.__new__(cls)
+        result._root = root
+        result._len = length
+        return result
+
+    def __getitem__(self, key):
+        h = _hash(key)
+        node = self._root
+        while True:
+            slot = node[h & _MASK]
+            if slot is None:
+                raise KeyError(key)
+            if type(slot) is list:
+                node = slot
+                h >>= _BITS
+            elif type(slot) is tuple:
+                if slot[0] == key:
+                    return slot[1]
+                raise KeyError(key)
+            else:
+                return slot[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        for key, _ in _iter(self._root):
+            yield key
+
+    def items(self):
+        return _iter(self._root)
+
+    def __len__(self):
+        return self._len
+
+    def set(self, key, value):
+        """Returns a copy of the map with key set to value."""
+        root, added = _assoc(self._root, _hash(key), 0, key, value, True)
+        return self._new(root, self._len + added)
+
+    def delete(self, key):
+        """Returns a copy of the map without key, or the map itself if key
+        is not in it."""
+        root = _dissoc(self._root, _hash(key), key)
+        if root is None:
+            return self
+        return self._new(root, self._len - 1)
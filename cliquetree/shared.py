@@ -0,0 +1,273 @@
+"""Concurrent reads of a CliqueTree that is updated by a single writer.
+
+The writer applies every update to a private CliqueTree and then publishes an
+immutable Snapshot of it. Publishing replaces a single attribute, so readers
+that call SharedCliqueTree.snapshot() never take a lock and never see a
+partial update: they keep reading the version they hold until they ask for a
+new one.
+
+The snapshots are made of persistent maps, so publishing an update costs
+O(log n) per node, clique and edge that it touched, not a copy of the tree.
+See benchmarks/bench_shared.py for the cost per update as n grows.
+"""
+from contextlib import contextmanager
+import threading
+
+from .cliquetree import CliqueTree
+from .pmap import PersistentMap
+
+
+class Snapshot(object):
+    """A read-only version of a CliqueTree, as published by SharedCliqueTree.
+
+    The adjacency, the cliques and the insertable partners of the nodes are
+    PersistentMaps of frozensets, and the deletable edges the keys of a
+    PersistentMap. None of them is modified once published, and the entries
+    that an update did not touch are shared with the previous version.
+    """
+    __slots__ = ('version', 'adj', 'node_in_cliques', 'nodes_in_clique',
+                 'insertable_nbrs', 'deletable', '_deletable',
+                 '_clique_number', '_insertable')
+
+    def __init__(self, version, adj, node_in_cliques, nodes_in_clique,
+                 insertable_nbrs, deletable, clique_number):
+        self.version = version
+        self.adj = adj
+        self.node_in_cliques = node_in_cliques
+        self.nodes_in_clique = nodes_in_clique
+        self.insertable_nbrs = insertable_nbrs
+        self._deletable = deletable
+        self.deletable = deletable.keys()
+        self._clique_number = clique_number
+        self._insertable = None
+
+    def __contains__(self, v):
+        return v in self.adj
+
+    def __len__(self):
+        return len(self.adj)
+
+    def nodes(self):
+        return list(self.adj)
+
+    def neighbors(self, v):
+        return self.adj[v]
+
+    def has_edge(self, u, v):
+        return v in self.adj.get(u, ())
+
+    def cliques(self, v):
+        """Returns the ids of the maximal cliques that contain v."""
+        return self.node_in_cliques.get(v, frozenset())
+
+    def query_edge(self, x, y):
+        """Returns True if the edge (x, y) can be added to the graph, like
+        CliqueTree.query_edge.
+        """
+        if x == y or self.has_edge(x, y):
+            return False
+        if x not in self.node_in_cliques or y not in self.node_in_cliques:
+            # a new node can always be connected
+            return True
+        return y in self.insertable_nbrs.get(x, ())
+
+    @property
+    def insertable(self):
+        """The insertable edges, as a frozenset of pairs (u, v) with u < v,
+        built on first use."""
+        if self._insertable is None:
+            self._insertable = frozenset(
+                (u, v) for u, nbrs in self.insertable_nbrs.items()
+                for v in nbrs if u < v)
+        return self._insertable
+
+    def clique_number(self):
+        return self._clique_number
+
+
+class SharedCliqueTree(object):
+    """Serves consistent versions of a CliqueTree to any number of reader
+    threads while one writer updates it.
+
+    The updates, add_edge, remove_edge, add_edges_from, remove_edges_from,
+    add_node and remove_node, take a lock, so concurrent writers are
+    serialized. Each one that changes the tree publishes a new Snapshot when
+    it is done, or, inside batch(), when the batch is done. The changes to
+    publish are read from the undo log of the tree, so publishing takes time
+    proportional to the size of the update times the logarithm of the size
+    of the tree. An update that raises is rolled back and publishes nothing.
+
+    tree must not be updated directly while it is shared.
+    """
+    def __init__(self, tree=None):
+        if tree is None:
+            tree = CliqueTree()
+        if not tree._insertable_valid or tree._pending_nodes:
+            tree._flush_insertable()
+        self.tree = tree
+        self._lock = threading.RLock()
+        self._batch = False
+        self._current = self._build(0)
+
+    def snapshot(self):
+        """Returns the latest published Snapshot, without blocking."""
+        return self._current
+
+    @property
+    def version(self):
+        return self._current.version
+
+    def add_edge(self, x, y):
+        return self._update(self.tree.add_edge, x, y)
+
+    def remove_edge(self, u, v):
+        return self._update(self.tree.remove_edge, u, v)
+
+    def add_edges_from(self, edges):
+        return self._update(self.tree.add_edges_from, edges)
+
+    def remove_edges_from(self, edges):
+        return self._update(self.tree.remove_edges_from, edges)
+
+    def add_node(self, v, neighbors=()):
+        return self._update(self.tree.add_node, v, neighbors)
+
+    def remove_node(self, v):
+        return self._update(self.tree.remove_node, v)
+
+    @contextmanager
+    def batch(self):
+        """Groups the updates made in the with block into a single version,
+        published when the block exits. If the block raises, all of them are
+        rolled back.
+        """
+        with self._lock:
+            if self._batch:
+                # nested in another batch, which publishes
+                yield self
+                return
+            self._batch = True
+            try:
+                with self._publishing():
+                    yield self
+            finally:
+                self._batch = False
+
+    def _update(self, method, *args):
+        with self._lock:
+            if self._batch:
+                return method(*args)
+            with self._publishing():
+                return method(*args)
+
+    @contextmanager
+    def _publishing(self):
+        tree = self.tree
+        tree.checkpoint()
+        start = len(tree._undo_log)
+        try:
+            yield
+        except BaseException:
+            tree.rollback()
+            raise
+        try:
+            entries = tree._undo_log[start:]
+            if entries:
+                self._current = self._publish(entries)
+        finally:
+            tree.commit()
+
+    def _build(self, version):
+        """Returns a Snapshot of the whole tree."""
+        tree = self.tree
+        return Snapshot(
+            version,
+            PersistentMap((v, frozenset(tree.G[v])) for v in tree.G),
+            PersistentMap((v, frozenset(cliques))
+                          for v, cliques in tree.node_in_cliques.items()),
+            PersistentMap((clq, frozenset(nodes))
+                          for clq, nodes in tree.nodes_in_clique.items()),
+            self._insertable_map(),
+            PersistentMap((e, True) for e in tree.deletable),
+            tree.clique_number())
+
+    def _insertable_map(self):
+        return PersistentMap((v, frozenset(nbrs)) for v, nbrs
+                             in self.tree._insertable_nbrs.items() if nbrs)
+
+    def _publish(self, entries):
+        """Returns the next Snapshot, which copies from the tree only the
+        entries touched by the changes in the undo log entries."""
+        tree = self.tree
+        old = self._current
+        version = old.version + 1
+        nodes = set()
+        cliques = set()
+        partners = set()
+        all_insertable = False
+        edges = set()
+        all_deletable = False
+        for entry in entries:
+            op = entry[0]
+            if op == 'reset':
+                return self._build(version)
+            elif op in ('add_node', 'remove_node'):
+                nodes.add(entry[1])
+            elif op in ('add_edge', 'remove_edge'):
+                nodes.update(entry[1:3])
+            elif op in ('add_clique', 'remove_clique'):
+                cliques.add(entry[1])
+                nodes.update(entry[2])
+            elif op in ('add_insertable', 'remove_insertable'):
+                partners.update(entry[1:3])
+            elif op == 'reset_insertable':
+                all_insertable = True
+            elif op in ('add_deletable', 'remove_deletable'):
+                edges.add(entry[1])
+            elif op == 'reset_deletable':
+                all_deletable = True
+        # the nodes of the added cliques are only known now
+        for clq in cliques:
+            nodes.update(tree.nodes_in_clique.get(clq, ()))
+
+        adj = old.adj
+        node_in_cliques = old.node_in_cliques
+        for v in nodes:
+            if v in tree.G:
+                adj = adj.set(v, frozenset(tree.G[v]))
+            else:
+                adj = adj.delete(v)
+            if v in tree.node_in_cliques:
+                node_in_cliques = node_in_cliques.set(
+                    v, frozenset(tree.node_in_cliques[v]))
+            else:
+                node_in_cliques = node_in_cliques.delete(v)
+        nodes_in_clique = old.nodes_in_clique
+        for clq in cliques:
+            if clq in tree.nodes_in_clique:
+                nodes_in_clique = nodes_in_clique.set(
+                    clq, frozenset(tree.nodes_in_clique[clq]))
+            else:
+                nodes_in_clique = nodes_in_clique.delete(clq)
+        if all_insertable:
+            insertable_nbrs = self._insertable_map()
+        else:
+            insertable_nbrs = old.insertable_nbrs
+            for v in partners:
+                nbrs = tree._insertable_nbrs.get(v)
+                if nbrs:
+                    insertable_nbrs = insertable_nbrs.set(v, frozenset(nbrs))
+                else:
+                    insertable_nbrs = insertable_nbrs.delete(v)
+        if all_deletable:
+            deletable = PersistentMap((e, True) for e in tree.deletable)
+        else:
+            deletable = old._deletable
+            for e in edges:
+                if e in tree.deletable:
+                    deletable = deletable.set(e, True)
+                else:
+                    deletable = deletable.delete(e)
+        return Snapshot(
+            version, adj, node_in_cliques, nodes_in_clique, insertable_nbrs,
+            deletable, tree.clique_number())
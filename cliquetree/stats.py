@@ -0,0 +1,78 @@
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+COUNTERS = ('path_length', 'cliques_created', 'cliques_removed',
+            'update_insertable', 'dfs_edges')
+PHASES = ('path_time', 'insertable_time', 'deletable_time')
+
+
+class Stats(object):
+    """Counters and timers of the edge updates of a CliqueTree, enabled with
+    CliqueTree.enable_stats.
+
+    Every add_edge, remove_edge, add_node and remove_node is described by a
+    dict with the keys:
+
+    - op, u, v: the name of the update and its edge, or its node as u
+    - accepted: False if the edge was rejected or did not change the graph
+    - time: the seconds spent in the update
+    - path_time, insertable_time, deletable_time: the seconds spent in
+      finding the path between the cliques of u and v, in recomputing the
+      insertable edges and in updating the deletable edges
+    - path_length: the number of clique tree edges on that path, which is
+      not counted when the clique tree has a path index
+    - cliques_created, cliques_removed: the cliques added to and removed
+      from the clique tree
+    - update_insertable, dfs_edges: the calls to update_insertable and the
+      clique tree edges that they visited
+    - insertable: the number of insertable edges after the update
+
+    The dict of the latest update is kept in last, and passed to callback,
+    if there is one. The sums of the counters and timers of all the updates
+    are kept in totals, along with the number of updates and of rejected
+    ones. Work done outside of an update, like the deferred recomputation
+    of add_edges_from, only counts towards the totals.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.last = None
+        self._current = None
+        self.reset()
+
+    def reset(self):
+        self.totals = dict.fromkeys(COUNTERS + PHASES, 0)
+        self.totals.update(updates=0, rejected=0, time=0)
+
+    def begin(self, op, u, v):
+        if self._current is not None:
+            # nested in another update, e.g. by a subclass
+            return False
+        event = dict.fromkeys(COUNTERS + PHASES, 0)
+        event.update(op=op, u=u, v=v, start=timer())
+        self._current = event
+        return True
+
+    def end(self, accepted, insertable):
+        event = self._current
+        self._current = None
+        event['time'] = timer() - event.pop('start')
+        event['accepted'] = accepted
+        event['insertable'] = insertable
+        self.totals['updates'] += 1
+        self.totals['time'] += event['time']
+        if not accepted:
+            self.totals['rejected'] += 1
+        self.last = event
+        if self.callback is not None:
+            self.callback(event)
+
+    def count(self, name, n=1):
+        self.totals[name] += n
+        if self._current is not None:
+            self._current[name] += n
+
+    def add_time(self, phase, start):
+        """Adds the time elapsed since start, a value of timer(), to a phase.
+        """
+        self.count(phase, timer() - start)
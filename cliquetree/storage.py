@@ -0,0 +1,334 @@
+"""Binary file format of a CliqueTree, see CliqueTree.save, CliqueTree.load
+and CliqueTree.open.
+
+A file starts with the magic bytes, the format version and the length of a
+JSON header, as little-endian unsigned 32-bit integers. The header holds the
+settings of the tree, the node labels and the offset and length of every
+array. The arrays follow, as little-endian signed 64-bit integers aligned to
+8 bytes, with the nodes replaced by their position in the labels:
+
+- adj_offsets, adj_targets: the adjacency lists of the graph, sorted
+- clique_ids, clique_offsets, clique_members: the nodes of each clique, in
+  increasing order of clique id
+- node_offsets, node_cliques: the cliques of each node
+- tree_edges, tree_sizes: the clique tree edges, as pairs of clique ids,
+  and the size of their separators
+- insertable_offsets, insertable_targets: the insertable partners of each
+  node, sorted; version 1 stored the insertable edges as pairs instead, in
+  an array named insertable
+- deletable: the deletable edges, as pairs
+
+The arrays are laid out so that MappedCliqueTree can answer queries from
+them in place. The format needs the 'q' array type and memoryview.cast,
+which were added in Python 3.3.
+"""
+from array import array
+import bisect
+import json
+import mmap
+import struct
+import sys
+
+MAGIC = b'CLQTREE\0'
+VERSION = 2
+_PREAMBLE = struct.Struct('<II')
+_ALIGN = 8
+
+
+def _csr(lists):
+    """Returns the offsets and the concatenation of a list of lists."""
+    offsets = array('q', [0])
+    values = array('q')
+    for items in lists:
+        values.extend(items)
+        offsets.append(len(values))
+    return offsets, values
+
+
+def _check_python():
+    if sys.version_info < (3, 3):
+        raise NotImplementedError('Saving and loading clique trees requires '
+                                  'Python 3.3 or later.')
+
+
+def save(tree, path):
+    _check_python()
+    labels = list(tree.G)
+    for v in labels:
+        if isinstance(v, bool) or not isinstance(v, (int, str)):
+            raise ValueError('Only int and str node labels can be saved, '
+                             'not %r.' % (v, ))
+    ids = dict((v, i) for i, v in enumerate(labels))
+    cliques = sorted(tree.nodes_in_clique)
+    tree_edges = list(tree.cliquetree.edges())
+    # the insertable edges are only stored if they are complete
+    insertable_valid = tree._insertable_valid and not tree._pending_nodes
+    arrays = {}
+    arrays['adj_offsets'], arrays['adj_targets'] = _csr(
+        sorted(ids[u] for u in tree.G[v]) for v in labels)
+    arrays['clique_ids'] = array('q', cliques)
+    arrays['clique_offsets'], arrays['clique_members'] = _csr(
+        [ids[v] for v in tree.nodes_in_clique[clq]] for clq in cliques)
+    arrays['node_offsets'], arrays['node_cliques'] = _csr(
+        tree.node_in_cliques.get(v, ()) for v in labels)
+    arrays['tree_edges'] = array('q', [clq for edge in tree_edges
+                                       for clq in edge])
+    arrays['tree_sizes'] = array('q', [tree._separator_size(clq1, clq2)
+                                       for clq1, clq2 in tree_edges])
+    arrays['insertable_offsets'], arrays['insertable_targets'] = _csr(
+        sorted(ids[u] for u in tree._insertable_nbrs.get(v, ()))
+        if insertable_valid else () for v in labels)
+    arrays['deletable'] = array('q', [ids[v] for edge in tree.deletable
+                                      for v in edge])
+
+    header = {
+        'settings': {'incremental': tree.incremental,
+                     'backend': tree.backend,
+                     'path_index': tree.path_index,
+                     'processes': tree.processes,
+                     'bitsets': tree.bitsets},
+        'uid': tree.uid,
+        'insertable_valid': insertable_valid,
+        'track_deletable': tree._track_deletable,
+        'labels': labels,
+        'arrays': {},
+    }
+    names = sorted(arrays)
+    # the offsets depend on the length of the header, which contains them
+    offset = 0
+    while True:
+        position = offset
+        for name in names:
+            header['arrays'][name] = [position, len(arrays[name])]
+            position += len(arrays[name]) * 8
+        encoded = json.dumps(header, sort_keys=True).encode('utf-8')
+        start = len(MAGIC) + _PREAMBLE.size + len(encoded)
+        start += -start % _ALIGN
+        if start == offset:
+            break
+        offset = start
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_PREAMBLE.pack(VERSION, len(encoded)))
+        f.write(encoded)
+        f.write(b'\0' * (offset - f.tell()))
+        for name in names:
+            values = arrays[name]
+            if sys.byteorder == 'big':
+                values.byteswap()
+            f.write(values.tobytes())
+
+
+def _read_header(data):
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError('Not a clique tree file.')
+    version, length = _PREAMBLE.unpack_from(data, len(MAGIC))
+    if version > VERSION:
+        raise ValueError('Unsupported clique tree file version: %d' %
+                         (version, ))
+    start = len(MAGIC) + _PREAMBLE.size
+    header = json.loads(bytes(data[start:start + length]).decode('utf-8'))
+    header['version'] = version
+    return header
+
+
+def _arrays(data, header):
+    """Returns the arrays of a file, as views of data if possible."""
+    result = {}
+    for name, (offset, count) in header['arrays'].items():
+        view = data[offset:offset + count * 8]
+        if sys.byteorder == 'little' and isinstance(view, memoryview):
+            result[name] = view.cast('q')
+        else:
+            values = array('q')
+            values.frombytes(bytes(view))
+            if sys.byteorder == 'big':
+                values.byteswap()
+            result[name] = values
+    return result
+
+
+def load(cls, path, use_mmap=True):
+    _check_python()
+    with open(path, 'rb') as f:
+        if use_mmap:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = memoryview(buf)
+        else:
+            buf = None
+            data = f.read()
+    try:
+        header = _read_header(data)
+        arrays = _arrays(data, header)
+        tree = _build(cls, header, arrays)
+        # release the views, so that the map can be closed
+        arrays = None
+    finally:
+        if buf is not None:
+            data.release()
+            buf.close()
+    return tree
+
+
+def _build(cls, header, arrays):
+    labels = header['labels']
+    tree = cls(**header['settings'])
+
+    offsets = arrays['adj_offsets']
+    targets = arrays['adj_targets']
+    tree.G.add_nodes_from(labels)
+    tree.G.add_edges_from((labels[i], labels[targets[j]])
+                          for i in range(len(labels))
+                          for j in range(offsets[i], offsets[i + 1])
+                          if i < targets[j])
+
+    offsets = arrays['clique_offsets']
+    members = arrays['clique_members']
+    for k, clq in enumerate(arrays['clique_ids']):
+        tree.nodes_in_clique[clq] = set(
+            labels[members[j]] for j in range(offsets[k], offsets[k + 1]))
+    tree._recount_cliques()
+    offsets = arrays['node_offsets']
+    cliques = arrays['node_cliques']
+    for i, v in enumerate(labels):
+        if offsets[i] < offsets[i + 1]:
+            tree.node_in_cliques[v] = set(cliques[offsets[i]:offsets[i + 1]])
+
+    for clq in tree.nodes_in_clique:
+        tree.cliquetree.add_node(clq)
+    edges = arrays['tree_edges']
+    for k in range(len(arrays['tree_sizes'])):
+        clq1, clq2 = edges[2 * k], edges[2 * k + 1]
+        tree.cliquetree.add_edge(clq1, clq2, nodes=tree.nodes_in_clique[clq1]
+                                 .intersection(tree.nodes_in_clique[clq2]))
+    tree._reindex_separators()
+    tree.uid = header['uid']
+
+    if 'insertable' in arrays:
+        pairs = arrays['insertable']
+        for k in range(0, len(pairs), 2):
+            tree._add_insertable(labels[pairs[k]], labels[pairs[k + 1]])
+    else:
+        offsets = arrays['insertable_offsets']
+        targets = arrays['insertable_targets']
+        for i in range(len(labels)):
+            for j in range(offsets[i], offsets[i + 1]):
+                if i < targets[j]:
+                    tree._add_insertable(labels[i], labels[targets[j]])
+    tree._insertable_valid = header['insertable_valid']
+    pairs = arrays['deletable']
+    tree.deletable = set(tree._edge(labels[pairs[k]], labels[pairs[k + 1]])
+                         for k in range(0, len(pairs), 2))
+    tree._deletable_clique = dict((e, tree._single_clique(*e))
+                                  for e in tree.deletable)
+    tree._track_deletable = header['track_deletable']
+    return tree
+
+
+class MappedCliqueTree(object):
+    """Read-only view of a file written by CliqueTree.save, which answers
+    queries from the memory-mapped arrays in place, see CliqueTree.open.
+
+    Processes that open the same file share its pages through the page
+    cache; each one only decodes the header and keeps the map from labels
+    to positions. The lookups of neighbors, insertable partners and cliques
+    use binary searches over the sorted arrays.
+    """
+    def __init__(self, path):
+        _check_python()
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = memoryview(self._map)
+        header = _read_header(self._data)
+        if header['version'] < 2:
+            self.close()
+            raise ValueError('Clique tree files of version %d can only be '
+                             'loaded, not opened.' % (header['version'], ))
+        self._arrays = _arrays(self._data, header)
+        self.labels = header['labels']
+        self._ids = dict((v, i) for i, v in enumerate(self.labels))
+        self.insertable_valid = header['insertable_valid']
+
+    def close(self):
+        """Releases the views and closes the map."""
+        if self._map is None:
+            return
+        arrays = getattr(self, '_arrays', {})
+        for values in arrays.values():
+            if isinstance(values, memoryview):
+                values.release()
+        self._arrays = {}
+        self._data.release()
+        self._map.close()
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, v):
+        return v in self._ids
+
+    def nodes(self):
+        return list(self.labels)
+
+    def _row(self, name, v):
+        i = self._ids[v]
+        offsets = self._arrays[name + '_offsets']
+        return offsets[i], offsets[i + 1]
+
+    def _has(self, name, u, v):
+        """Returns True if v is in the sorted row of u in the CSR arrays
+        name_offsets and name_targets."""
+        if u not in self._ids or v not in self._ids:
+            return False
+        lo, hi = self._row(name, u)
+        targets = self._arrays[name + '_targets']
+        target = self._ids[v]
+        i = bisect.bisect_left(targets, target, lo, hi)
+        return i < hi and targets[i] == target
+
+    def neighbors(self, v):
+        lo, hi = self._row('adj', v)
+        targets = self._arrays['adj_targets']
+        return [self.labels[targets[j]] for j in range(lo, hi)]
+
+    def has_edge(self, u, v):
+        return self._has('adj', u, v)
+
+    def cliques(self, v):
+        """Returns the ids of the cliques that contain v."""
+        i = self._ids[v]
+        offsets = self._arrays['node_offsets']
+        return list(self._arrays['node_cliques'][offsets[i]:offsets[i + 1]])
+
+    def clique(self, clq):
+        """Returns the nodes of the clique with the given id."""
+        ids = self._arrays['clique_ids']
+        k = bisect.bisect_left(ids, clq)
+        if k == len(ids) or ids[k] != clq:
+            raise KeyError(clq)
+        offsets = self._arrays['clique_offsets']
+        members = self._arrays['clique_members']
+        return [self.labels[members[j]]
+                for j in range(offsets[k], offsets[k + 1])]
+
+    def query_edge(self, x, y):
+        """Returns True if the edge (x, y) can be added to the graph, like
+        CliqueTree.query_edge. Raises ValueError if the insertable edges
+        were not complete when the file was saved.
+        """
+        if x == y or self.has_edge(x, y):
+            return False
+        if x not in self._ids or y not in self._ids:
+            # a new node can always be connected
+            return True
+        if not self.insertable_valid:
+            raise ValueError('The insertable edges were not saved.')
+        return self._has('insertable', x, y)
@@ -0,0 +1,101 @@
+"""Applies a stream of edge updates to a clique tree.
+
+Every line of the stream is an update: '+ u v' adds the edge (u, v) and
+'- u v' removes it. Empty lines and lines that start with '#' are skipped.
+
+    python -m cliquetree.stream [options] [file]
+
+reads the updates from the file, or from the standard input, applies them as
+they are read and writes one line per update with its outcome.
+"""
+from __future__ import print_function
+
+import argparse
+import sys
+import time
+
+from .cliquetree import CliqueTree
+
+
+def read_events(lines, nodetype=None):
+    """Parses lines of '+ u v' and '- u v' updates and yields them as
+    (op, u, v) tuples, converting the nodes with nodetype if it is given.
+    """
+    for lineno, line in enumerate(lines, 1):
+        tokens = line.split()
+        if not tokens or tokens[0].startswith('#'):
+            continue
+        if len(tokens) != 3 or tokens[0] not in ('+', '-'):
+            raise ValueError('Invalid edge update on line %d: %s' %
+                             (lineno, line.rstrip()))
+        op, u, v = tokens
+        if nodetype is not None:
+            u = nodetype(u)
+            v = nodetype(v)
+        yield op, u, v
+
+
+def _format(result):
+    line = '%s %s %s %s' % (result.op, result.u, result.v,
+                            'accepted' if result.accepted else 'rejected')
+    for kind in ('insertable', 'deletable'):
+        added = getattr(result, kind + '_added')
+        removed = getattr(result, kind + '_removed')
+        if added is not None:
+            line += ' %s +%d -%d' % (kind, len(added), len(removed))
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Applies a stream of "+ u v" and "- u v" edge updates '
+                    'to a chordal graph.')
+    parser.add_argument('file', nargs='?', default='-',
+                        help='file with one update per line (default: stdin)')
+    parser.add_argument('--nodetype', choices=('str', 'int'), default='str',
+                        help='type of the node labels')
+    parser.add_argument('--backend', choices=('networkx', 'compact'),
+                        default='networkx', help='clique tree backend')
+    parser.add_argument('--path-index', action='store_true',
+                        help='index the clique tree with a link-cut tree')
+    parser.add_argument('--insertable', action='store_true',
+                        help='maintain the insertable edges')
+    parser.add_argument('--deletable', action='store_true',
+                        help='maintain the deletable edges')
+    parser.add_argument('--deltas', action='store_true',
+                        help='report how many edges became, or stopped '
+                             'being, insertable and deletable')
+    parser.add_argument('--flush-every', type=int, default=1, metavar='N',
+                        help='recompute the insertable edges every N '
+                             'updates (0: only at the end)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='only print a summary')
+    args = parser.parse_args(argv)
+
+    tree = CliqueTree(backend=args.backend, path_index=args.path_index)
+    nodetype = int if args.nodetype == 'int' else None
+    stream = sys.stdin if args.file == '-' else open(args.file)
+    events = read_events(stream, nodetype)
+    counts = {True: 0, False: 0}
+    start = time.time()
+    try:
+        for result in tree.apply_events(events, insertable=args.insertable,
+                                        deletable=args.deletable,
+                                        deltas=args.deltas,
+                                        flush_every=args.flush_every or None):
+            counts[result.accepted] += 1
+            if not args.quiet:
+                print(_format(result))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    elapsed = time.time() - start
+    total = counts[True] + counts[False]
+    print('%d updates, %d accepted, %d rejected in %.2fs (%.0f updates/s)' %
+          (total, counts[True], counts[False], elapsed,
+           total / elapsed if elapsed > 0 else 0), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -61,4 +61,9 @@ setup(
     extras_require={
         'tests': tests_require,
     },
+    entry_points={
+        'console_scripts': [
+            'cliquetree-stream = cliquetree.stream:main',
+        ],
+    },
 )
@@ -1,6 +1,17 @@
 from __future__ import division
 
+import os
+import pickle
+import random
+import tempfile
+import threading
+
+import networkx as nx
+
 from cliquetree import CliqueTree
+from cliquetree import SharedCliqueTree
+from cliquetree.pmap import PersistentMap
+from cliquetree.stream import read_events
 
 
 def test_insertable1():
@@ -65,3 +76,858 @@ def test_update():
     c.update_insertable(7, stop_at=1)
     assert len(c.insertable) == 1
     assert len(c.insertable.intersection(solutions[10])) == 1
+
+
+def _random_updates(c, seed, n=12, steps=60):
+    """Applies a random sequence of edge insertions and deletions to c and
+    yields after every update."""
+    rng = random.Random(seed)
+    for _ in range(steps):
+        if c.G.number_of_edges() and rng.random() < 0.35:
+            deletable = [(u, v) for u, v in c.G.edges()
+                         if len(c.node_in_cliques[u]
+                                .intersection(c.node_in_cliques[v])) == 1]
+            if not deletable:
+                continue
+            c.remove_edge(*rng.choice(deletable))
+        else:
+            c.add_edge(*rng.sample(range(n), 2))
+        yield
+
+
+def test_incremental_insertable():
+    for seed in range(20):
+        c = CliqueTree()
+        for _ in _random_updates(c, seed):
+            full = CliqueTree(incremental=False)
+            full.from_graph(c.G)
+            assert c.insertable == full.insertable
+
+
+def test_is_insertable():
+    for seed in range(20):
+        c = CliqueTree()
+        for _ in _random_updates(c, seed):
+            for u in range(12):
+                for v in range(u + 1, 12):
+                    expected = (u, v) in c.insertable or \
+                        (u in c.G) != (v in c.G) or \
+                        (u not in c.G and v not in c.G)
+                    assert c.is_insertable(u, v) == expected
+
+
+def test_compact_backend():
+    for seed in range(20):
+        c = CliqueTree()
+        compact = CliqueTree(backend='compact')
+        for _, _ in zip(_random_updates(c, seed), _random_updates(compact,
+                                                                   seed)):
+            assert compact.insertable == c.insertable
+            assert sorted(compact.cliquetree.edges()) == \
+                sorted(c._edge(*e) for e in c.cliquetree.edges())
+            for c1, c2, data in c.cliquetree.edges(data=True):
+                assert compact.cliquetree[c1][c2]['nodes'] == data['nodes']
+
+    # the center of a star has enough neighbors to be indexed
+    c = CliqueTree()
+    compact = CliqueTree(backend='compact')
+    for tree in (c, compact):
+        tree.from_graph(nx.star_graph(40))
+        tree.add_edge(1, 2)
+        tree.remove_edge(0, 3)
+        tree.add_edge(3, 4)
+        tree.remove_edge(0, 40)
+    assert compact.insertable == c.insertable
+    for c1, c2, data in c.cliquetree.edges(data=True):
+        assert compact.cliquetree.has_edge(c2, c1)
+        assert compact._separator_size(c1, c2) == len(data['nodes'])
+    assert sorted(compact.cliquetree.edges()) == \
+        sorted(c._edge(*e) for e in c.cliquetree.edges())
+
+
+def test_batch_updates():
+    edges = [(1, 2), (2, 3), (3, 4), (4, 1), (4, 5), (5, 6), (6, 7), (3, 5),
+             (2, 5)]
+    c = CliqueTree()
+    rejected = c.add_edges_from(edges)
+    assert rejected == [(4, 1)]
+    full = CliqueTree(incremental=False)
+    full.from_graph(c.G)
+    assert c.insertable == full.insertable
+
+    assert c.remove_edges_from([(3, 5), (6, 7)]) == [(3, 5)]
+    assert not c.G.has_edge(6, 7)
+    full = CliqueTree(incremental=False)
+    full.from_graph(c.G)
+    assert c.insertable == full.insertable
+
+    for seed in range(20):
+        rng = random.Random(seed)
+        c = CliqueTree()
+        for _ in range(5):
+            c.add_edges_from(tuple(rng.sample(range(15), 2))
+                             for _ in range(10))
+            c.remove_edges_from(rng.sample(sorted(c.G.edges()), 3))
+            full = CliqueTree(incremental=False)
+            full.from_graph(c.G)
+            assert c.insertable == full.insertable
+
+
+def test_from_graph():
+    for seed in range(20):
+        c = CliqueTree()
+        for _ in _random_updates(c, seed, n=15):
+            pass
+        tree = CliqueTree()
+        tree.from_graph(c.G)
+        assert sorted(map(sorted, tree.nodes_in_clique.values())) == \
+            sorted(map(sorted, nx.find_cliques(c.G)))
+        # the cliques of every node form a subtree
+        for v in tree.G:
+            assert nx.is_connected(
+                tree.cliquetree.subgraph(tree.node_in_cliques[v]))
+        for c1, c2, data in tree.cliquetree.edges(data=True):
+            assert data['nodes'] == tree.nodes_in_clique[c1].intersection(
+                tree.nodes_in_clique[c2])
+        assert nx.number_connected_components(tree.cliquetree) == \
+            nx.number_connected_components(tree.G)
+        assert tree.insertable == c.insertable
+
+        # without the insertable edges, which the next update computes
+        lazy = CliqueTree()
+        lazy.from_graph(c.G, update_insertable=False)
+        assert _state(lazy)[:-2] == _state(tree)[:-2]
+        assert not lazy.insertable
+        for u in c.G:
+            for v in c.G:
+                assert lazy.query_edge(u, v) == tree.query_edge(u, v)
+        if c.insertable:
+            u, v = sorted(c.insertable)[0]
+            lazy.add_edge(u, v)
+            tree.add_edge(u, v)
+            assert lazy.insertable == tree.insertable
+
+
+def test_tree_path():
+    for seed in range(10):
+        c = CliqueTree()
+        for _ in _random_updates(c, seed):
+            pass
+        for c1 in c.cliquetree:
+            for c2 in c.cliquetree:
+                try:
+                    path = c._tree_path(c1, c2)
+                except nx.NetworkXNoPath:
+                    assert not nx.has_path(c.cliquetree, c1, c2)
+                else:
+                    assert path == nx.shortest_path(c.cliquetree, c1, c2)
+    # the search stops when the smaller side is exhausted
+    c = CliqueTree()
+    for v in range(1, 500):
+        c.add_edge(v - 1, v, update_insertable=False)
+    c.add_edge(1000, 1001, update_insertable=False)
+    expanded = []
+    neighbors = c.cliquetree.neighbors
+
+    def counted(clq):
+        expanded.append(clq)
+        return neighbors(clq)
+    c.cliquetree.neighbors = counted
+    source = min(c.node_in_cliques[0])
+    target = min(c.node_in_cliques[1000])
+    try:
+        c._tree_path(source, target)
+    except nx.NetworkXNoPath:
+        pass
+    else:
+        assert False
+    assert len(expanded) <= 2
+
+
+def test_from_graph_not_chordal():
+    c = CliqueTree()
+    try:
+        c.from_graph(nx.cycle_graph(4))
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def _state(c):
+    return (sorted(c.G.nodes()), sorted(map(sorted, c.G.edges())),
+            sorted((c._edge(c1, c2), sorted(c._separator(c1, c2)))
+                   for c1, c2 in c.cliquetree.edges()),
+            sorted(c.cliquetree.nodes()),
+            dict((k, sorted(v)) for k, v in c.node_in_cliques.items()),
+            dict((k, sorted(v)) for k, v in c.nodes_in_clique.items()),
+            sorted(c.insertable), c.uid)
+
+
+def test_checkpoint_rollback():
+    for backend in ('networkx', 'compact'):
+        for seed in range(10):
+            c = CliqueTree(backend=backend)
+            updates = _random_updates(c, seed, steps=80)
+            for _ in range(20):
+                next(updates)
+            before = _state(c)
+            c.checkpoint()
+            for _ in range(10):
+                next(updates)
+            middle = _state(c)
+            c.checkpoint()
+            for _ in range(10):
+                next(updates)
+            c.rollback()
+            assert _state(c) == middle
+            c.from_graph(nx.path_graph(5))
+            c.rollback()
+            assert _state(c) == before
+            # the tree keeps working after the rollback
+            for _ in updates:
+                full = CliqueTree(incremental=False)
+                full.from_graph(c.G)
+                assert c.insertable == full.insertable
+
+
+def test_checkpoint_commit():
+    c = CliqueTree()
+    c.add_edges_from([(1, 2), (2, 3)])
+    c.checkpoint()
+    c.add_edge(3, 4)
+    c.checkpoint()
+    c.add_edge(1, 3)
+    c.commit()
+    c.rollback()
+    assert sorted(map(sorted, c.G.edges())) == [[1, 2], [2, 3]]
+    assert c.insertable == set([(1, 3)])
+    assert c._undo_log is None
+
+    # a rollback keeps the recomputations deferred before its checkpoint
+    c = CliqueTree()
+    events = c.apply_events([('+', 1, 2), ('+', 2, 3), ('+', 10, 11)],
+                            insertable=True, flush_every=None)
+    next(events)
+    next(events)
+    c.checkpoint()
+    c.rollback()
+    assert c.query_edge(1, 3)
+    for _ in events:
+        pass
+    full = CliqueTree(incremental=False)
+    full.from_graph(c.G)
+    assert c.insertable == full.insertable
+
+
+def test_try_add_edge():
+    c = CliqueTree()
+    c.add_edges_from([(1, 2), (2, 3), (3, 4), (4, 5)])
+    before = _state(c)
+    tx = c.try_add_edge(1, 3)
+    assert tx.result is True
+    assert c.G.has_edge(1, 3)
+    assert (1, 4) in c.insertable
+    tx.rollback()
+    assert _state(c) == before
+
+    tx = c.try_add_edge(1, 4)
+    assert tx.result is False
+    tx.commit()
+    assert _state(c) == before
+
+    c.try_add_edge(5, 6).commit()
+    assert c.G.has_edge(5, 6)
+    assert c._undo_log is None
+
+
+def test_transaction():
+    c = CliqueTree()
+    c.add_edges_from([(1, 2), (2, 3)])
+    before = _state(c)
+    with c.transaction() as tx:
+        c.add_edge(3, 4)
+        c.add_edge(2, 4)
+        tx.rollback()
+    assert _state(c) == before
+
+    try:
+        with c.transaction():
+            c.add_edge(3, 4)
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert _state(c) == before
+
+    with c.transaction():
+        c.add_edge(3, 4)
+        with c.transaction() as inner:
+            c.add_edge(4, 5)
+            inner.rollback()
+    assert c.G.has_edge(3, 4) and not c.G.has_edge(4, 5)
+    assert 5 not in c.G
+
+
+def test_deletable():
+    for seed in range(20):
+        c = CliqueTree()
+        c.update_deletable()
+        for _ in _random_updates(c, seed):
+            cliques = list(map(set, nx.find_cliques(c.G)))
+            expected = set(c._edge(u, v) for u, v in c.G.edges()
+                           if sum(1 for clq in cliques
+                                  if u in clq and v in clq) == 1)
+            assert c.deletable == expected
+    c.checkpoint()
+    c.remove_edge(*sorted(c.deletable)[0])
+    c.rollback()
+    assert c.deletable == expected
+
+
+def test_path_index():
+    for backend in ('networkx', 'compact'):
+        for seed in range(20):
+            c = CliqueTree()
+            indexed = CliqueTree(backend=backend, path_index=True)
+            for _, _ in zip(_random_updates(c, seed),
+                            _random_updates(indexed, seed)):
+                assert indexed.insertable == c.insertable
+            for u in range(12):
+                for v in range(u + 1, 12):
+                    assert indexed.is_insertable(u, v) == c.is_insertable(u, v)
+    copy = indexed.copy()
+    assert copy.insertable == indexed.insertable
+    for u, v in sorted(copy.insertable):
+        assert copy.add_edge(u, v) == indexed.add_edge(u, v)
+    assert copy.insertable == indexed.insertable
+
+
+def test_path_index_pickle():
+    c = CliqueTree(path_index=True)
+    for v in range(2999):
+        c.add_edge(v, v + 1, update_insertable=False)
+    c2 = pickle.loads(pickle.dumps(c, pickle.HIGHEST_PROTOCOL))
+    assert c2.nodes_in_clique == c.nodes_in_clique
+    assert c2.cliquetree.tree._adj == c.cliquetree.tree._adj
+    assert c2.cliquetree._nodes is c2.nodes_in_clique
+    assert c2.is_insertable(0, 2)
+    assert not c2.is_insertable(0, 2999)
+    c2.remove_edge(1000, 1001, update_insertable=False)
+    assert c2.is_insertable(0, 2999)
+    assert not c2.is_insertable(0, 1000)
+
+
+def test_apply_events():
+    lines = ['# a triangle and a square', '+ 1 2', '+ 2 3', '+ 1 3', '',
+             '+ 3 4', '+ 4 5', '+ 5 1', '- 1 3', '- 1 2']
+    events = list(read_events(lines, int))
+    assert events[0] == ('+', 1, 2)
+    c = CliqueTree()
+    results = list(c.apply_events(events))
+    assert [r.accepted for r in results] == \
+        [True, True, True, True, True, False, True, True]
+    assert results[0].insertable_added is None
+    assert not c._insertable_valid
+
+    expected = CliqueTree()
+    c = CliqueTree()
+    insertable = set()
+    deletable = set()
+    for r in c.apply_events(events, insertable=True, deletable=True,
+                            deltas=True):
+        if r.accepted:
+            if r.op == '+':
+                expected.add_edge(r.u, r.v)
+            else:
+                expected.remove_edge(r.u, r.v)
+        insertable = (insertable | r.insertable_added) - r.insertable_removed
+        deletable = (deletable | r.deletable_added) - r.deletable_removed
+        assert insertable == c.insertable == expected.insertable
+        assert deletable == c.deletable
+
+    c = CliqueTree()
+    for r in c.apply_events(events, insertable=True, flush_every=None):
+        assert not c.insertable
+    assert c.insertable == expected.insertable
+
+    # queries between the events see the deferred updates
+    for flush_every in (None, 3):
+        c = CliqueTree()
+        for r in c.apply_events(events, insertable=True,
+                                flush_every=flush_every):
+            for u in range(1, 6):
+                for v in range(u + 1, 6):
+                    assert c.query_edge(u, v) == c.is_insertable(u, v)
+
+
+def test_read_events_invalid():
+    try:
+        list(read_events(['* 1 2']))
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_parallel_insertable():
+    rng = random.Random(0)
+    G = nx.Graph()
+    cliques = [[0]]
+    for v in range(1, 60):
+        # v is simplicial, so G stays chordal
+        clq = rng.choice(cliques)
+        clq = rng.sample(clq, rng.randint(1, len(clq)))
+        G.add_edges_from((u, v) for u in clq)
+        cliques.append(clq + [v])
+    G.add_edge(100, 101)
+    c = CliqueTree()
+    c.from_graph(G)
+    for backend in ('networkx', 'compact'):
+        parallel = CliqueTree(backend=backend, processes=2)
+        parallel.from_graph(G)
+        assert parallel.insertable == c.insertable
+
+
+def test_bitsets():
+    for seed in range(20):
+        c = CliqueTree()
+        bitsets = CliqueTree(bitsets=True)
+        for _, _ in zip(_random_updates(c, seed),
+                        _random_updates(bitsets, seed)):
+            assert bitsets.insertable == c.insertable
+        bitsets.checkpoint()
+        for u, v in sorted(c.insertable):
+            bitsets.add_edge(u, v)
+        bitsets.rollback()
+        if c.insertable:
+            u, v = sorted(c.insertable)[-1]
+            c.add_edge(u, v)
+            bitsets.add_edge(u, v)
+        assert bitsets.insertable == c.insertable
+    # with a narrower bound, most bitmaps are too wide to be cached and are
+    # rebuilt by every search
+    from cliquetree import cliquetree as cliquetree_module
+    bits_per_node = cliquetree_module._BITS_PER_NODE
+    cliquetree_module._BITS_PER_NODE = 2
+    try:
+        for seed in range(5):
+            c = CliqueTree()
+            bitsets = CliqueTree(bitsets=True)
+            for _, _ in zip(_random_updates(c, seed),
+                            _random_updates(bitsets, seed)):
+                assert bitsets.insertable == c.insertable
+            for clq, bits in bitsets._bits_in_clique.items():
+                size = len(bitsets.nodes_in_clique[clq])
+                assert bits.bit_length() <= 2 * size
+    finally:
+        cliquetree_module._BITS_PER_NODE = bits_per_node
+    # the ids of removed nodes are reused, so node churn does not widen the
+    # bitmaps
+    c = CliqueTree()
+    bitsets = CliqueTree(bitsets=True)
+    for tree in (c, bitsets):
+        tree.add_edges_from([(1, 2), (2, 3), (3, 4)])
+    for v in range(100, 300):
+        for tree in (c, bitsets):
+            tree.checkpoint()
+            tree.add_node(v + 1000, [3])
+            tree.rollback()
+            tree.add_node(v, [3, 4])
+            tree.remove_node(v - 1 if v > 100 else 1)
+        assert bitsets.insertable == c.insertable
+    ids = bitsets._vertex_bits.ids
+    assert sorted(ids) == sorted(bitsets.G)
+    assert max(ids.values()) < 6
+
+
+def test_stats():
+    c = CliqueTree()
+    events = []
+    stats = c.enable_stats(events.append)
+    c.add_edges_from([(1, 2), (2, 3), (3, 4)])
+    assert c.add_edge(1, 4) is False
+    c.add_edge(1, 3)
+    assert [e['accepted'] for e in events] == [True, True, True, False, True]
+    assert events[-1] is stats.last
+    assert stats.last['insertable'] == len(c.insertable)
+    assert stats.last['path_length'] == 1
+    assert stats.last['cliques_created'] == 1
+    assert stats.last['cliques_removed'] == 2
+    assert stats.last['update_insertable'] > 0
+    assert stats.totals['updates'] == 5 and stats.totals['rejected'] == 1
+    assert stats.totals['cliques_created'] == 4
+    c.remove_edge(3, 4)
+    assert stats.last['op'] == 'remove_edge' and stats.last['accepted']
+    c.disable_stats()
+    c.add_edge(3, 4)
+    assert stats.totals['updates'] == 6
+
+
+def test_iter_insertable():
+    for seed in range(10):
+        c = CliqueTree()
+        for _ in _random_updates(c, seed):
+            edges = list(c.iter_insertable_all())
+            assert len(edges) == len(c.insertable)
+            assert set(edges) == c.insertable
+        for v in c.G:
+            edges = [c._edge(*e) for e in c.iter_insertable(v)]
+            assert len(edges) == len(set(edges))
+            assert set(edges) == set(e for e in c.insertable if v in e)
+    first = next(c.iter_insertable(v), None)
+    assert first is None or c._edge(*first) in c.insertable
+
+
+def test_greedy_add_edges():
+    for seed in range(10):
+        rng = random.Random(seed)
+        c = CliqueTree()
+        for _ in _random_updates(c, seed, steps=20):
+            pass
+        weights = dict(((u, v), rng.randint(0, 5))
+                       for u in range(12) for v in range(u + 1, 12))
+        expected = c.copy()
+        added = []
+        while expected.insertable and len(added) < 15:
+            e = min(expected.insertable, key=lambda e: (-weights[e], e))
+            if weights[e] < 1:
+                break
+            expected.add_edge(*e)
+            added.append(e)
+        assert c.greedy_add_edges(weights, k=15, min_score=1) == added
+        assert c.G.edges() == expected.G.edges()
+        assert c.insertable == expected.insertable
+    c = CliqueTree()
+    c.add_edges_from([(1, 2), (2, 3), (3, 4)])
+    assert c.add_edge(4, 1) is False
+    assert c.greedy_add_edges(lambda u, v: u + v) == [(2, 4), (1, 4), (1, 3)]
+
+
+def test_save_load():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        for backend in ('networkx', 'compact'):
+            c = CliqueTree(backend=backend)
+            c.update_deletable()
+            for _ in _random_updates(c, 0):
+                pass
+            c.save(path)
+            for mmap in (True, False):
+                loaded = CliqueTree.load(path, mmap=mmap)
+                assert loaded.backend == backend
+                assert _state(loaded) == _state(c)
+                assert loaded.deletable == c.deletable
+                expected = c.copy()
+                for u, v in sorted(c.insertable):
+                    assert loaded.add_edge(u, v) == expected.add_edge(u, v)
+                assert _state(loaded) == _state(expected)
+                assert loaded.deletable == expected.deletable
+        c = CliqueTree()
+        c.add_edge((1, 2), (3, 4))
+        try:
+            c.save(path)
+        except ValueError:
+            pass
+        else:
+            assert False
+    finally:
+        os.remove(path)
+
+
+def test_open():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        for seed in range(5):
+            c = CliqueTree()
+            for _ in _random_updates(c, seed):
+                pass
+            c.save(path)
+            with CliqueTree.open(path) as opened:
+                assert len(opened) == len(c.G)
+                assert sorted(opened.nodes()) == sorted(c.G)
+                for u in list(c.G) + [99]:
+                    assert (u in opened) == (u in c.G)
+                    for v in list(c.G) + [99]:
+                        assert opened.query_edge(u, v) == c.query_edge(u, v)
+                        assert opened.has_edge(u, v) == c.G.has_edge(u, v)
+                for v in c.G:
+                    assert sorted(opened.neighbors(v)) == sorted(c.G[v])
+                    assert set(opened.cliques(v)) == \
+                        c.node_in_cliques.get(v, set())
+                for clq, nodes in c.nodes_in_clique.items():
+                    assert set(opened.clique(clq)) == nodes
+        c = CliqueTree()
+        c.add_edge(1, 2, update_insertable=False)
+        c.add_edge(3, 4, update_insertable=False)
+        c.save(path)
+        opened = CliqueTree.open(path)
+        assert opened.query_edge(1, 5) is True
+        try:
+            opened.query_edge(1, 3)
+        except ValueError:
+            pass
+        else:
+            assert False
+        opened.close()
+        # files of version 1 stored the insertable edges as pairs
+        with open(path, 'r+b') as f:
+            f.seek(8)
+            f.write(b'\1\0\0\0')
+        assert CliqueTree.load(path).G.edges() == c.G.edges()
+        try:
+            CliqueTree.open(path)
+        except ValueError:
+            pass
+        else:
+            assert False
+    finally:
+        os.remove(path)
+
+
+def test_analytics():
+    for seed in range(10):
+        c = CliqueTree()
+        c.checkpoint()
+        for _ in _random_updates(c, seed):
+            cliques = list(nx.find_cliques(c.G))
+            omega = max(map(len, cliques)) if cliques else 0
+            assert c.clique_number() == omega
+            assert c.treewidth() == omega - 1
+        assert len(c.max_clique()) == omega
+
+        order = c.perfect_elimination_ordering()
+        assert sorted(order) == sorted(c.G)
+        position = dict((v, i) for i, v in enumerate(order))
+        for v in order:
+            later = [u for u in c.G[v] if position[u] > position[v]]
+            assert all(c.G.has_edge(u, w) for i, u in enumerate(later)
+                       for w in later[i + 1:])
+
+        colors = c.coloring()
+        assert set(colors) == set(c.G)
+        assert all(colors[u] != colors[v] for u, v in c.G.edges())
+        assert max(colors.values()) == omega - 1
+
+        mis = c.maximum_independent_set()
+        assert not any(c.G.has_edge(u, v) for u in mis for v in mis)
+        complement = nx.complement(c.G)
+        assert len(mis) == max(map(len, nx.find_cliques(complement)))
+        c.rollback()
+        assert c.clique_number() == 0
+
+
+def test_add_remove_node():
+    for seed in range(20):
+        rng = random.Random(seed)
+        c = CliqueTree()
+        c.update_deletable()
+        for _ in _random_updates(c, seed, steps=30):
+            pass
+        for step in range(15):
+            before = _state(c)
+            c.checkpoint()
+            if rng.random() < 0.5 and len(c.G):
+                c.remove_node(rng.choice(sorted(c.G)))
+            else:
+                v = 100 + step
+                clq = sorted(rng.choice(list(c.nodes_in_clique.values()))) \
+                    if c.nodes_in_clique else []
+                c.add_node(v, rng.sample(clq, rng.randint(0, len(clq))))
+            expected = CliqueTree()
+            expected.from_graph(c.G)
+            expected.update_deletable()
+            assert c.insertable == expected.insertable
+            assert c.deletable == expected.deletable
+            assert c.clique_number() == expected.clique_number()
+            assert sorted(map(sorted, c.nodes_in_clique.values())) == \
+                sorted(map(sorted, nx.find_cliques(c.G)))
+            if step % 3 == 0:
+                c.rollback()
+                assert _state(c) == before
+            else:
+                c.commit()
+    c = CliqueTree()
+    c.add_node(1)
+    c.add_edge(1, 2)
+    assert list(c.nodes_in_clique.values()) == [set([1, 2])]
+    # without updating them, the insertable edges are recomputed later
+    c = CliqueTree()
+    c.add_edges_from([(1, 2), (2, 3)])
+    c.add_node(9)
+    c.remove_node(9, update_insertable=False)
+    assert (1, 9) not in c.insertable
+    c.add_edge(3, 4)
+    assert c.insertable == set([(1, 3), (2, 4)])
+    c = CliqueTree()
+    c.add_edges_from([(1, 2), (2, 3)])
+    try:
+        c.add_node(4, [1, 3])
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+class _Collision(object):
+    """A key whose hash collides with every other _Collision."""
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return 7
+
+    def __eq__(self, other):
+        return isinstance(other, _Collision) and self.value == other.value
+
+
+def test_persistent_map():
+    rng = random.Random(0)
+    keys = list(range(300)) + [_Collision(i) for i in range(5)]
+    m = PersistentMap()
+    expected = {}
+    versions = []
+    for _ in range(2000):
+        key = rng.choice(keys)
+        if rng.random() < 0.4:
+            m = m.delete(key)
+            expected.pop(key, None)
+        else:
+            value = rng.random()
+            m = m.set(key, value)
+            expected[key] = value
+        versions.append((m, dict(expected)))
+    # every version is left as it was when it was returned
+    for version, items in versions[::50]:
+        assert len(version) == len(items)
+        assert dict(version.items()) == items
+        for key in keys:
+            assert (key in version) == (key in items)
+            assert version.get(key) == items.get(key)
+    assert PersistentMap(expected) == expected
+
+
+def _snapshot_matches(snapshot, c):
+    assert sorted(snapshot.nodes()) == sorted(c.G.nodes())
+    for v in c.G:
+        assert snapshot.neighbors(v) == set(c.G[v])
+    assert snapshot.node_in_cliques == c.node_in_cliques
+    assert snapshot.nodes_in_clique == c.nodes_in_clique
+    assert snapshot.insertable == c.insertable
+    assert snapshot.deletable == c.deletable
+    assert snapshot.clique_number() == c.clique_number()
+
+
+def test_shared_snapshots():
+    for seed in range(10):
+        rng = random.Random(seed)
+        c = CliqueTree()
+        c.update_deletable()
+        shared = SharedCliqueTree(c)
+        for step in range(40):
+            old = shared.snapshot()
+            frozen = (old.version, dict(old.adj), old.insertable)
+            u, v = rng.sample(range(12), 2)
+            if rng.random() < 0.3 and c.G.has_edge(u, v):
+                try:
+                    shared.remove_edge(u, v)
+                except ValueError:
+                    # rejected updates are rolled back and not published
+                    assert shared.snapshot() is old
+                    continue
+            elif step % 10 == 9:
+                with shared.batch():
+                    shared.add_edge(u, v)
+                    shared.add_node(100 + step, [u, v] if c.G.has_edge(u, v)
+                                    else [u])
+            else:
+                shared.add_edge(u, v)
+            assert (old.version, old.adj, old.insertable) == frozen
+            assert shared.version - old.version in (0, 1)
+            _snapshot_matches(shared.snapshot(), c)
+            for x, y in c.insertable:
+                assert shared.snapshot().query_edge(x, y)
+        try:
+            with shared.batch():
+                shared.add_edge(0, 50)
+                raise ValueError
+        except ValueError:
+            pass
+        assert not c.G.has_edge(0, 50)
+        _snapshot_matches(shared.snapshot(), c)
+
+    shared = SharedCliqueTree()
+    errors = []
+    done = []
+
+    def read():
+        version = 0
+        while not done:
+            snapshot = shared.snapshot()
+            if snapshot.version < version:
+                errors.append('version went back')
+            version = snapshot.version
+            for v in snapshot.nodes():
+                for u in snapshot.neighbors(v):
+                    if not snapshot.has_edge(u, v) or \
+                            snapshot.query_edge(u, v):
+                        errors.append((u, v))
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    rng = random.Random(0)
+    for _ in range(200):
+        shared.add_edge(*rng.sample(range(30), 2))
+    done.append(True)
+    for thread in readers:
+        thread.join()
+    assert not errors
+
+
+def test_structure_index():
+    for backend in ('networkx', 'compact'):
+        for seed in range(10):
+            c = CliqueTree(backend=backend, path_index=seed % 2 == 1)
+            c.update_deletable()
+            c.checkpoint()
+            for step, _ in enumerate(_random_updates(c, seed, steps=40)):
+                if step == 20:
+                    c.rollback()
+                sizes = {}
+                for clq1, clq2 in c.cliquetree.edges():
+                    size = c._separator_size(clq1, clq2)
+                    sizes[size] = sizes.get(size, 0) + 1
+                    assert c._edge(clq1, clq2) in c.separators_of_size(size)
+                assert c.separator_sizes() == sizes
+                if sizes:
+                    assert c._separator_size(*c.largest_separator()) == \
+                        max(sizes)
+                else:
+                    assert c.largest_separator() is None
+                maximal = list(map(set, nx.find_cliques(c.G)))
+                histogram = {}
+                for nodes in maximal:
+                    histogram[len(nodes)] = histogram.get(len(nodes), 0) + 1
+                assert c.clique_sizes() == histogram
+                for u, v in c.G.edges():
+                    cliques = [nodes for nodes in maximal
+                               if u in nodes and v in nodes]
+                    found = c.cliques_containing(u, v)
+                    assert sorted(map(sorted, cliques)) == sorted(
+                        sorted(c.nodes_in_clique[clq]) for clq in found)
+                    clq = c.clique_of_edge(u, v)
+                    if len(cliques) == 1:
+                        assert c.nodes_in_clique[clq] == cliques[0]
+                    else:
+                        assert clq is None
+    c = CliqueTree()
+    c.add_edge(6, 0)
+    c.remove_edge(6, 0)
+    c.add_edge(6, 4)
+    assert c.clique_sizes() == {1: 1, 2: 1}
+    c = CliqueTree()
+    c.add_edges_from([(1, 2), (2, 3), (1, 3), (3, 4)])
+    assert c.clique_of_edge(1, 2) in c.cliques_containing(1, 2)
+    assert c.clique_of_edge(1, 4) is None
+    assert c.cliques_containing(1, 4) == set()